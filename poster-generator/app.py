@@ -1,33 +1,47 @@
-from flask import Flask, render_template, request, jsonify, send_file, redirect, url_for, flash
-from PIL import Image
-from io import BytesIO
+import time
+_import_started = time.perf_counter()
+
+from flask import Flask, render_template, request, jsonify, send_file, redirect, url_for, flash, abort, Response, stream_with_context, g
 import os
-import base64
 from dotenv import load_dotenv
-from google import genai
-from google.genai import types
+
+# Load environment variables before the local modules below, which read
+# their settings at import time
+load_dotenv()
+
 import tempfile
 import shutil
 import uuid
-import re
 import json
-from datetime import datetime
-
-# Load environment variables
-load_dotenv()
+import click
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+import image_store
+import suggestions
+import concept
+import backends
+import genai_client
+from cache import prompt_cache, TwoTierCache
+from generation_cache import DedupingBackend
+import image_pipeline
+import derivatives
+import metrics
+from image_pipeline import SourceImage
+from compositing import overlay_logo, DEFAULT_LOGO_SCALE, LOGO_POSITIONS
+from jobs import JobManager, JobStore, QueueFull
+from history_store import HistoryStore
+from prompt_features import extract_key_features
+from batches import BatchManager, BatchStore, parse_manifest, expand_manifest, batch_status, stream_zip
 
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 app.secret_key = os.environ.get("FLASK_SECRET_KEY", "default_secret_key")  # Needed for session management
 
 # --- Gemini prompt enhancement ---
-def enhance_prompt_gemini(prompt):
-    client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY"))
-    model = "gemini-2.0-flash-001"
-    contents = [
-        types.Content(
-            role="user",
-            parts=[types.Part(text=f"""You are an expert prompt engineer specializing in generating high-resolution, visually compelling posters using the Imagen 4 model. Your objective is to meticulously translate user-provided poster concepts into detailed, structured prompts that maximize visual quality, avoid distortions, and eliminate spelling errors or extraneous text.
+# The instructions never change, so the ~4 KB text is built once at import
+# and each call only appends the user's prompt.
+ENHANCE_MODEL = "gemini-2.0-flash-001"
+ENHANCE_INSTRUCTIONS = """You are an expert prompt engineer specializing in generating high-resolution, visually compelling posters using the Imagen 4 model. Your objective is to meticulously translate user-provided poster concepts into detailed, structured prompts that maximize visual quality, avoid distortions, and eliminate spelling errors or extraneous text.
 For each user prompt provided, you will generate a comprehensive description that adheres to the following criteria:
 Title/Theme: Clearly and concisely state the primary message or title of the poster. Ensure it is impactful and easily understood.
 Visual Style: Define a specific and coherent artistic style. Use descriptive terms such as:
@@ -79,87 +93,418 @@ Example of desired output based on the provided example:
 "Create a high-resolution poster for an 'Annual Tech Fest 2025'. The visual style should be clean and modern, utilizing a bold color palette of electric blue and crisp white. The main title, 'Annual Tech Fest 2025', should be rendered in a large, bold sans-serif font, prominently placed at the top. The background should feature abstract, subtle tech-themed geometric patterns that do not distract from the main content. Incorporate a designated empty space in the top-left corner for a college logo placement. The overall tone should be energetic and appealing to young students, suitable for a college campus display. Prioritize exceptional readability and immediate visual impact."
 Now, this is the user prompt:
                               
-{prompt}
-
-""")]
-        )
-    ]
-    generate_config = types.GenerateContentConfig(
-        thinking_config=types.ThinkingConfig(),
-        response_mime_type="text/plain"
-    )
+"""
 
-    response_text = ""
-    for chunk in client.models.generate_content_stream(
-        model=model,
-        contents=contents,
-        config=generate_config
-    ):
-        response_text += chunk.text
+def enhance_prompt_gemini(prompt, fresh=False):
+    model = ENHANCE_MODEL
+    # Repeated prompts are answered from the cache unless fresh=True
+    if fresh:
+        prompt_cache.bypass('enhance')
+    else:
+        cached = prompt_cache.get('enhance', model, prompt)
+        if cached is not None:
+            return cached
+    with metrics.timed('gemini_enhance'):
+        response_text = genai_client.complete(model, ENHANCE_INSTRUCTIONS + prompt + '\n\n')
+    if response_text:
+        prompt_cache.set('enhance', model, prompt, response_text)
     return response_text
 
-# --- Imagen image generation ---
-def generate_poster(prompt, aspect_ratio):
-    client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY"))
-    result = client.models.generate_images(
-        model="models/imagen-4.0-generate-preview-06-06",
-        prompt=prompt,
-        config=dict(
-            number_of_images=3,
-            output_mime_type="image/jpeg",
-            person_generation="ALLOW_ADULT",
-            aspect_ratio=aspect_ratio,
-        ),
-    )
-
-    if not result.generated_images:
-        return []
+def enhance_concept_gemini(prompt, fresh=False):
+    """Enhanced prompt, objects, color combinations and key features for a
+    prompt from one structured Gemini call (GEMINI_STRUCTURED=1).
+
+    Falls back to the separate enhancement and suggestion calls if the
+    structured response cannot be used.
+    """
+    def compute():
+        with metrics.timed('gemini_concept'):
+            result = concept.parse_concept(genai_client.complete(
+                ENHANCE_MODEL, ENHANCE_INSTRUCTIONS + prompt + '\n\n' + concept.CONCEPT_OUTPUT,
+                schema=concept.CONCEPT_SCHEMA))
+        concept.remember(result)
+        return result
+    try:
+        return prompt_cache.get_or_compute('concept', ENHANCE_MODEL, prompt, compute, fresh=fresh)
+    except ValueError:
+        enhanced_prompt = enhance_prompt_gemini(prompt, fresh=fresh)
+        objects, color_combinations = suggestions.suggest(enhanced_prompt, fresh=fresh)
+        return {'enhanced_prompt': enhanced_prompt, 'objects': objects, 'color_combinations': color_combinations,
+                'features': extract_key_features(enhanced_prompt)}
 
-    images = [Image.open(BytesIO(img.image.image_bytes)).convert("RGBA") for img in result.generated_images]
+# --- Imagen image generation ---
+# The backend is chosen by POSTER_IMAGE_BACKEND ('imagen' or 'fake' for offline runs).
+# Identical concurrent requests share one upstream call, and with
+# IMAGEN_REUSE_SECONDS set an exact repeat is served from the image store.
+image_backend = DedupingBackend(backends.get_backend())
+
+POSTERS_PER_GENERATION = 3
+
+def generate_poster(prompt, aspect_ratio, number_of_images=POSTERS_PER_GENERATION, slot=0):
+    # Posters stay as the JPEG bytes Imagen returned; they are only decoded if a logo is drawn on them
+    with metrics.timed('imagen'):
+        image_bytes = image_backend.generate(prompt, aspect_ratio, number_of_images=number_of_images, slot=slot)
+    images = [SourceImage(data) for data in image_bytes]
     return images
 
-# --- Overlay logo on poster ---
-def overlay_logo(poster, logo, position, scale):
-    logo = logo.convert("RGBA")
-    logo_width = int(poster.width * scale)
-    logo = logo.resize((logo_width, int(logo.height * (logo_width / logo.width))))
-    x, y = position
-    poster = poster.copy()
-    poster.paste(logo, (int(x), int(y)), logo)
-    return poster
-
 # --- Persistent history ---
-HISTORY_FILE = 'generation_history.json'
-generation_history = []
+HISTORY_FILE = 'generation_history.json'  # legacy format, imported once into the database
+HISTORY_DB = os.environ.get('POSTER_HISTORY_DB', 'generation_history.db')
+HISTORY_PAGE_SIZE = 20
+HISTORY_MAX_PAGE_SIZE = 100
+history_store = HistoryStore(HISTORY_DB, legacy_json=HISTORY_FILE)
+
+# --- Poster storage ---
+def store_source_poster(source, index):
+    # Untouched upstream bytes: no decode, no re-encode
+    return {
+        'id': f'poster_{index}',
+        'hash': image_store.put_image(source.data),
+        'width': source.width,
+        'height': source.height,
+        'format': source.format,
+        'bytes': len(source.data)
+    }
 
-def load_history():
-    global generation_history
-    if os.path.exists(HISTORY_FILE):
-        with open(HISTORY_FILE, 'r', encoding='utf-8') as f:
+def store_poster(img, index, fmt='jpeg'):
+    data, encode_ms = image_pipeline.encode(img, fmt)
+    return {
+        'id': f'poster_{index}',
+        'hash': image_store.put_image(data),
+        'width': img.width,
+        'height': img.height,
+        'format': fmt,
+        'bytes': len(data),
+        'encode_ms': round(encode_ms, 1)
+    }
+
+def poster_srcset(poster):
+    # Responsive candidates for <img srcset>, largest last. Entries imported
+    # from the old JSON history have no recorded width, so they only get the
+    # derivatives at their nominal widths.
+    width = poster.get('width')
+    candidates = [
+        f"{url_for('serve_derivative', image_hash=poster['hash'], variant=variant)} {variant_width}w"
+        for variant, variant_width in derivatives.VARIANTS.items()
+        if not width or variant_width < width
+    ]
+    if width:
+        candidates.append(f"{url_for('serve_image', image_hash=poster['hash'])} {width}w")
+    return ', '.join(candidates)
+
+app.jinja_env.globals['poster_srcset'] = poster_srcset
+
+def poster_urls(poster_data):
+    return [dict(p, url=url_for('serve_image', image_hash=p['hash']),
+                 thumb_url=url_for('serve_derivative', image_hash=p['hash'], variant='thumb'),
+                 srcset=poster_srcset(p))
+            for p in poster_data]
+
+# --- Generation jobs ---
+# Generation runs on a bounded background pool; requests submit a job and
+# clients poll /jobs/<id> or subscribe to /jobs/<id>/events.
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '4'))
+JOB_QUEUE_DEPTH = int(os.environ.get('JOB_QUEUE_DEPTH', '16'))
+
+# In fan-out mode each poster is requested on its own and delivered as soon
+# as it is ready, so the first poster arrives with the fastest image rather
+# than the slowest, and one failed image does not sink the others.
+POSTER_FANOUT = os.environ.get('POSTER_FANOUT', '1') == '1'
+fanout_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS * POSTERS_PER_GENERATION, thread_name_prefix='fanout')
+
+def render_poster(source, logo_hash, logo_position, index, output_format='jpeg'):
+    # The logo-free original is always kept, so /overlay-logo can re-place the logo later
+    base = store_source_poster(source, index)
+    if not logo_hash:
+        return base
+    try:
+        poster = overlay_logo(source.decode(), logo_hash, logo_position, scale=DEFAULT_LOGO_SCALE)
+    except Exception:
+        return base
+    return dict(store_poster(poster, index, output_format), base_hash=base['hash'])
+
+def generate_single_poster(prompt, aspect_ratio, logo_hash, logo_position, index, output_format):
+    posters = generate_poster(prompt, aspect_ratio, number_of_images=1, slot=index)
+    if not posters:
+        raise RuntimeError('No image returned')
+    return render_poster(posters[0], logo_hash, logo_position, index, output_format)
+
+def run_generation(params, progress):
+    prompt = params['prompt']
+    aspect_ratio = params['aspect_ratio']
+    logo_position = params.get('logo_position', 'top-left')
+    logo_hash = params.get('logo_hash')
+    output_format = params.get('output_format', 'jpeg')
+    poster_data = []
+    errors = []
+    if params.get('fanout', POSTER_FANOUT):
+        futures = {
+            fanout_executor.submit(metrics.bind(generate_single_poster), prompt, aspect_ratio, logo_hash, logo_position, i, output_format): i
+            for i in range(POSTERS_PER_GENERATION)
+        }
+        for future in as_completed(futures):
             try:
-                generation_history = json.load(f)
-            except Exception:
-                generation_history = []
+                poster_data.append(future.result())
+            except Exception as e:
+                errors.append({'id': f'poster_{futures[future]}', 'error': str(e)})
+            progress({'posters': poster_data, 'errors': errors})
     else:
-        generation_history = []
+        posters = generate_poster(prompt, aspect_ratio)
+        for i, poster in enumerate(posters):
+            poster_data.append(render_poster(poster, logo_hash, logo_position, i, output_format))
+    if not poster_data:
+        raise RuntimeError(errors[0]['error'] if errors else 'Failed to generate posters')
+    # Thumbnails and previews are made off the request path
+    derivatives.schedule([p['hash'] for p in poster_data])
+    # Save to history with timestamp
+    with metrics.timed('history_append'):
+        history_store.append({
+            'prompt': prompt,
+            'enhanced_prompt': params.get('enhanced_prompt', ''),
+            'aspect_ratio': aspect_ratio,
+            'posters': sorted(poster_data, key=lambda p: p['id']),
+            'timestamp': datetime.now().isoformat()
+        })
+    return {'posters': poster_data, 'errors': errors}
+
+job_manager = JobManager(run_generation, JobStore(HISTORY_DB), max_workers=JOB_WORKERS, max_queue=JOB_QUEUE_DEPTH)
+
+def submit_generation(prompt, aspect_ratio, logo_file=None, logo_position='top-left', fanout=None, enhanced_prompt=''):
+    params = {'prompt': prompt, 'aspect_ratio': aspect_ratio, 'logo_position': logo_position,
+              # Posters with a logo have to be re-encoded; use a format this client accepts
+              'output_format': image_pipeline.negotiate_format(request.accept_mimetypes)}
+    if fanout is not None:
+        params['fanout'] = fanout
+    if enhanced_prompt:
+        # Kept with the history entry, where search indexes its features
+        params['enhanced_prompt'] = enhanced_prompt
+    if logo_file and logo_file.filename:
+        # Jobs run on another thread (or are read by another process), so the
+        # upload is stored once and referenced by hash.
+        params['logo_hash'] = image_store.put_image(logo_file.read())
+    return job_manager.submit(params)
+
+def parse_fanout(data):
+    # fanout=0/1 overrides the POSTER_FANOUT default for one request
+    value = data.get('fanout')
+    if value is None or value == '':
+        return None
+    return str(value).lower() in ('1', 'true')
+
+def job_json(job):
+    result = job['result'] or {}
+    return {
+        'id': job['id'],
+        'status': job['status'],
+        'error': job['error'],
+        'posters': poster_urls(result.get('posters', [])),
+        'errors': result.get('errors', []),
+        'status_url': url_for('job_status', job_id=job['id']),
+        'events_url': url_for('job_events', job_id=job['id']),
+    }
 
-def save_history():
-    with open(HISTORY_FILE, 'w', encoding='utf-8') as f:
-        json.dump(generation_history, f, ensure_ascii=False, indent=2)
+def queue_full_response(error):
+    response = jsonify({'error': str(error), 'retry_after': error.retry_after})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+# --- Batch generation ---
+# Each batch item goes through the same steps as the interactive flow
+# (enhance, generate, overlay) and lands in the history like any other poster.
+def run_batch_item(params):
+    prompt = params['prompt']
+    enhanced_prompt = enhance_prompt_gemini(prompt) if params.get('enhance') else ''
+    posters = generate_poster(enhanced_prompt or prompt, params['aspect_ratio'], number_of_images=params['images'])
+    if not posters:
+        raise RuntimeError('No image returned')
+    poster_data = [render_poster(poster, params.get('logo_hash'), params['logo_position'], i, params.get('output_format', 'jpeg'))
+                   for i, poster in enumerate(posters)]
+    derivatives.schedule([p['hash'] for p in poster_data])
+    with metrics.timed('history_append'):
+        history_store.append({
+            'prompt': prompt,
+            'enhanced_prompt': enhanced_prompt,
+            'aspect_ratio': params['aspect_ratio'],
+            'posters': poster_data,
+            'timestamp': datetime.now().isoformat()
+        })
+    return {'enhanced_prompt': enhanced_prompt, 'posters': poster_data}
+
+batch_manager = BatchManager(run_batch_item, BatchStore(HISTORY_DB))
+
+def batch_json(batch):
+    counts = {}
+    for item in batch['items']:
+        counts[item['status']] = counts.get(item['status'], 0) + 1
+    return {
+        'id': batch['id'],
+        'status': batch_status(batch),
+        'total': len(batch['items']),
+        'counts': counts,
+        'duplicates': batch['duplicates'],
+        'items': [dict(
+            {k: v for k, v in item['params'].items() if k not in ('logo_hash', 'output_format')},
+            position=item['position'],
+            status=item['status'],
+            attempts=item['attempts'],
+            error=item['error'],
+            enhanced_prompt=(item['result'] or {}).get('enhanced_prompt'),
+            posters=poster_urls((item['result'] or {}).get('posters', [])),
+        ) for item in batch['items']],
+        'status_url': url_for('batch_status_route', batch_id=batch['id']),
+        'resume_url': url_for('resume_batch', batch_id=batch['id']),
+        'download_url': url_for('download_batch', batch_id=batch['id']),
+    }
 
-# Load history at startup
-load_history()
+@app.cli.command('import-history')
+@click.argument('json_path', default=HISTORY_FILE)
+def import_history_command(json_path):
+    """Import a generation_history.json file, moving base64 posters into the image store."""
+    # A store without legacy_json, so opening it does not auto-import (and rename) the same file first
+    print(f'Imported {HistoryStore(HISTORY_DB).import_json(json_path)} new history entries.')
+
+@app.cli.command('backfill-derivatives')
+def backfill_derivatives_command():
+    """Create missing thumbnails and previews for every poster in the history."""
+    posters = written = failed = 0
+    before = before_id = None
+    while True:
+        entries, next_cursor = history_store.page(before=before, before_id=before_id, limit=HISTORY_MAX_PAGE_SIZE)
+        for entry in entries:
+            for poster in entry.get('posters', []):
+                if not image_store.has_image(poster.get('hash')):
+                    continue
+                posters += 1
+                try:
+                    written += derivatives.ensure_derivatives(poster['hash'])
+                except Exception as e:
+                    failed += 1
+                    print(f"{poster['hash']}: {e}")
+        if next_cursor is None:
+            break
+        before, before_id = next_cursor
+    print(f'Checked {posters} posters, wrote {written} derivatives, {failed} failed.')
+
+# --- Request metrics ---
+# Stage timings recorded while handling a request (including work it waited
+# for on the job and fan-out pools) are returned in a Server-Timing header.
+# With POSTER_PROFILING=1, ?profile=1 samples the stacks of every thread
+# while the request runs and writes them to POSTER_PROFILE_DIR.
+@app.before_request
+def start_request_metrics():
+    if metrics.METRICS_ENABLED:
+        g.metrics_started = time.perf_counter()
+        g.metrics_token = metrics.start_request()
+        metrics.requests_in_flight.add(request.endpoint)
+    if metrics.PROFILING_ENABLED and request.args.get('profile') == '1':
+        g.sampler = metrics.Sampler().start()
+
+@app.after_request
+def finish_request_metrics(response):
+    if 'metrics_started' in g:
+        elapsed = time.perf_counter() - g.metrics_started
+        metrics.request_seconds.observe(request.endpoint, elapsed)
+        if response.status_code >= 500:
+            metrics.request_errors.add(request.endpoint)
+        response.headers['Server-Timing'] = metrics.server_timing(metrics.request_timings(), total=elapsed)
+    if 'sampler' in g:
+        response.headers['X-Profile'] = g.pop('sampler').stop(request.endpoint or 'unknown')
+    return response
+
+@app.teardown_request
+def teardown_request_metrics(error):
+    if 'metrics_token' in g:
+        metrics.requests_in_flight.add(request.endpoint, -1)
+        metrics.end_request(g.pop('metrics_token'))
 
 # --- Routes ---
 @app.route('/', methods=['GET'])
 def landing():
     return render_template('landing.html')
 
+def send_immutable(path, etag):
+    # Content never changes for a given hash, so the hash doubles as a strong
+    # ETag and the response can be cached forever. send_file handles
+    # If-None-Match / If-Modified-Since and Range requests.
+    response = send_file(
+        os.path.abspath(path),
+        mimetype=image_store.file_mimetype(path),
+        conditional=True,
+        etag=etag,
+        max_age=31536000,
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+@app.route('/images/<image_hash>')
+def serve_image(image_hash):
+    if not image_store.has_image(image_hash):
+        abort(404)
+    return send_immutable(image_store.image_path(image_hash), image_hash)
+
+@app.route('/images/<image_hash>/<variant>')
+def serve_derivative(image_hash, variant):
+    if variant not in derivatives.VARIANTS or not image_store.has_image(image_hash):
+        abort(404)
+    path = derivatives.derivative_path(image_hash, variant)
+    if not os.path.exists(path):
+        # Not made yet (or an old poster that was never backfilled)
+        derivatives.ensure_derivatives(image_hash)
+    return send_immutable(path, f'{image_hash}-{variant}')
+
+def history_filters(args):
+    """Search filters from query args: q, aspect_ratio and a from/to date range (YYYY-MM-DD, inclusive)."""
+    filters = {key: args.get(key, '').strip() for key in ('q', 'aspect_ratio', 'from', 'to')}
+    since = until = None
+    if filters['from']:
+        since = datetime.strptime(filters['from'], '%Y-%m-%d').date().isoformat()
+    if filters['to']:
+        until = (datetime.strptime(filters['to'], '%Y-%m-%d').date() + timedelta(days=1)).isoformat()
+    search = {'query': filters['q'], 'aspect_ratio': filters['aspect_ratio'] or None, 'since': since, 'until': until}
+    return {k: v for k, v in filters.items() if v}, search
+
 @app.route('/history')
 def history():
-    # Sort by most recent first
-    sorted_history = sorted(generation_history, key=lambda x: x.get('timestamp', ''), reverse=True)
-    return render_template('history.html', history=sorted_history)
+    # Most recent first, one page at a time: ?before=<timestamp>&limit=N
+    # (before_id breaks ties between entries with the same timestamp)
+    before = request.args.get('before') or None
+    before_id = request.args.get('before_id', type=int)
+    limit = request.args.get('limit', HISTORY_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+    filter_error = None
+    try:
+        filters, search = history_filters(request.args)
+    except ValueError:
+        filters, search = {}, None
+        filter_error = 'Dates must be in YYYY-MM-DD format.'
+    if filters:
+        # Filtered pages are cursored by id alone
+        entries, next_id = history_store.search(before_id=before_id, limit=limit, **search)
+        next_cursor = (None, next_id) if next_id is not None else None
+    else:
+        entries, next_cursor = history_store.page(before=before, before_id=before_id, limit=limit)
+    return render_template('history.html', history=entries, before=before or before_id, next_cursor=next_cursor, limit=limit,
+                           filters=filters, filter_error=filter_error, aspect_ratios=list(backends.ASPECT_RATIO_SIZES))
+
+@app.route('/history/search')
+def history_search():
+    # JSON search API: ?q=<words>&aspect_ratio=&from=&to=&before_id=&limit=
+    try:
+        filters, search = history_filters(request.args)
+    except ValueError:
+        return jsonify({'error': 'from and to must be YYYY-MM-DD'}), 400
+    limit = max(1, min(request.args.get('limit', HISTORY_PAGE_SIZE, type=int), HISTORY_MAX_PAGE_SIZE))
+    started = time.perf_counter()
+    entries, next_id = history_store.search(before_id=request.args.get('before_id', type=int), limit=limit, **search)
+    took_ms = (time.perf_counter() - started) * 1000
+    return jsonify({
+        'entries': [dict(entry, posters=poster_urls([p for p in entry.get('posters', []) if p.get('hash')])) for entry in entries],
+        'next_before_id': next_id,
+        'next_url': url_for('history_search', before_id=next_id, limit=limit, **filters) if next_id is not None else None,
+        'took_ms': round(took_ms, 2),
+    })
 
 @app.route('/enhance', methods=['POST'])
 def enhance():
@@ -168,60 +513,16 @@ def enhance():
     if not prompt:
         flash('Prompt is required.')
         return redirect(url_for('landing'))
-    # Call Gemini for enhanced prompt
-    enhanced_prompt = enhance_prompt_gemini(prompt)
-    # Call Gemini to suggest objects and color combinations
-    try:
-        client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY"))
-        model = "gemini-2.0-flash-001"
-        # Suggest objects
-        objects_prompt = f"""
-Given the following enhanced poster prompt, suggest a list of 5-8 distinct visual objects, motifs, or elements that would be visually compelling and relevant for the poster. Return only a JSON array of short object names or phrases, nothing else.\n\nPrompt:\n{enhanced_prompt}
-"""
-        color_prompt = f"""
-Given the following enhanced poster prompt, suggest 3-5 harmonious color combinations (each as a short descriptive phrase, e.g., 'emerald green and brushed gold', 'deep ocean blue and bright coral'). Return only a JSON array of color combination strings, nothing else.\n\nPrompt:\n{enhanced_prompt}
-"""
-        # Get objects
-        objects_contents = [types.Content(role="user", parts=[types.Part(text=objects_prompt)])]
-        color_contents = [types.Content(role="user", parts=[types.Part(text=color_prompt)])]
-        generate_config = types.GenerateContentConfig(
-            thinking_config=types.ThinkingConfig(),
-            response_mime_type="text/plain"
-        )
-        # Objects
-        objects_response = ""
-        for chunk in client.models.generate_content_stream(
-            model=model,
-            contents=objects_contents,
-            config=generate_config
-        ):
-            if hasattr(chunk, 'text') and chunk.text:
-                objects_response += chunk.text
-        import json as _json
-        try:
-            objects = _json.loads(objects_response)
-            if not isinstance(objects, list):
-                objects = [str(objects)]
-        except Exception:
-            objects = []
-        # Colors
-        colors_response = ""
-        for chunk in client.models.generate_content_stream(
-            model=model,
-            contents=color_contents,
-            config=generate_config
-        ):
-            if hasattr(chunk, 'text') and chunk.text:
-                colors_response += chunk.text
-        try:
-            color_combinations = _json.loads(colors_response)
-            if not isinstance(color_combinations, list):
-                color_combinations = [str(color_combinations)]
-        except Exception:
-            color_combinations = []
-    except Exception:
-        objects = []
-        color_combinations = []
+    fresh = request.form.get('fresh') == '1'
+    if concept.STRUCTURED_ENABLED:
+        # One call returns the enhanced prompt and the suggestions together
+        result = enhance_concept_gemini(prompt, fresh=fresh)
+        enhanced_prompt, objects, color_combinations = result['enhanced_prompt'], result['objects'], result['color_combinations']
+    else:
+        # Call Gemini for enhanced prompt
+        enhanced_prompt = enhance_prompt_gemini(prompt, fresh=fresh)
+        # Suggest objects and color combinations (both requests run concurrently)
+        objects, color_combinations = suggestions.suggest(enhanced_prompt, fresh=fresh)
     return render_template('enhance.html', prompt=prompt, aspect_ratio=aspect_ratio, enhanced_prompt=enhanced_prompt, objects=objects, color_combinations=color_combinations)
 
 @app.route('/generate', methods=['POST'])
@@ -242,53 +543,15 @@ def step4():
     aspect_ratio = request.form.get('aspect_ratio', '9:16')
     logo_file = request.files.get('logo')
     logo_position = request.form.get('logo_position', 'top-left')
-    # Generate posters
-    posters = generate_poster(prompt, aspect_ratio)
-    poster_data = []
-    # Logo overlay logic
-    def get_logo_xy(pos, poster, logo, scale=0.18):
-        w, h = poster.width, poster.height
-        lw = int(w * scale)
-        lh = int(logo.height * (lw / logo.width))
-        if pos == 'top-left':
-            return (int(w*0.03), int(h*0.03))
-        elif pos == 'top-right':
-            return (w - lw - int(w*0.03), int(h*0.03))
-        elif pos == 'bottom-left':
-            return (int(w*0.03), h - lh - int(h*0.03))
-        elif pos == 'bottom-right':
-            return (w - lw - int(w*0.03), h - lh - int(h*0.03))
-        elif pos == 'center':
-            return ((w - lw)//2, (h - lh)//2)
-        else:
-            return (int(w*0.03), int(h*0.03))
-    for i, poster in enumerate(posters):
-        img = poster
-        if logo_file and logo_file.filename:
-            try:
-                logo = Image.open(logo_file.stream).convert("RGBA")
-                pos = get_logo_xy(logo_position, poster, logo)
-                img = overlay_logo(poster, logo, pos, scale=0.18)
-            except Exception:
-                pass
-        buffered = BytesIO()
-        img.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode()
-        poster_data.append({
-            'id': f'poster_{i}',
-            'image': img_str,
-            'width': img.width,
-            'height': img.height
-        })
-    # Save to history with timestamp
-    generation_history.append({
-        'prompt': prompt,
-        'aspect_ratio': aspect_ratio,
-        'posters': poster_data,
-        'timestamp': datetime.now().isoformat()
-    })
-    save_history()
-    return render_template('generate.html', posters=poster_data, prompt=prompt, aspect_ratio=aspect_ratio)
+    # Queue generation; the page follows the job's progress and shows the posters when done
+    try:
+        job_id = submit_generation(prompt, aspect_ratio, logo_file, logo_position, parse_fanout(request.form), enhanced_prompt)
+    except QueueFull as e:
+        response = app.make_response((render_template('generate.html', posters=[], prompt=prompt, aspect_ratio=aspect_ratio, error=str(e)), 429))
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response
+    job = job_json(job_manager.get(job_id))
+    return render_template('generate.html', posters=job['posters'], job=job, prompt=prompt, aspect_ratio=aspect_ratio)
 
 @app.route('/enhance-prompt', methods=['POST'])
 def enhance_prompt():
@@ -299,7 +562,9 @@ def enhance_prompt():
         if not user_prompt:
             return jsonify({'error': 'Prompt is required'}), 400
         
-        enhanced_prompt = enhance_prompt_gemini(user_prompt)
+        if concept.STRUCTURED_ENABLED:
+            return jsonify(enhance_concept_gemini(user_prompt, fresh=bool(data.get('fresh'))))
+        enhanced_prompt = enhance_prompt_gemini(user_prompt, fresh=bool(data.get('fresh')))
         return jsonify({'enhanced_prompt': enhanced_prompt})
     
     except Exception as e:
@@ -310,57 +575,184 @@ def generate_poster_route():
     try:
         # Accept both JSON and multipart/form-data
         if request.content_type and request.content_type.startswith('multipart/form-data'):
-            prompt = request.form.get('prompt', '')
-            aspect_ratio = request.form.get('aspect_ratio', '9:16')
+            data = request.form
         else:
             data = request.get_json()
-            prompt = data.get('prompt', '')
-            aspect_ratio = data.get('aspect_ratio', '9:16')
+        prompt = data.get('prompt', '')
+        aspect_ratio = data.get('aspect_ratio', '9:16')
+        # async=1 returns the job right away (202) instead of waiting for the posters
+        run_async = str(data.get('async', request.args.get('async', ''))).lower() in ('1', 'true')
 
         if not prompt:
             return jsonify({'error': 'Prompt is required'}), 400
 
-        posters = generate_poster(prompt, aspect_ratio)
-
-        if not posters:
-            return jsonify({'error': 'Failed to generate posters'}), 500
-
         # Do NOT overlay logo in backend. Only return generated posters.
-        poster_data = []
-        for i, poster in enumerate(posters):
-            buffered = BytesIO()
-            poster.save(buffered, format="PNG")
-            img_str = base64.b64encode(buffered.getvalue()).decode()
-            poster_data.append({
-                'id': f'poster_{i}',
-                'image': img_str,
-                'width': poster.width,
-                'height': poster.height
-            })
-
-        # Save to history with timestamp
-        generation_history.append({
-            'prompt': prompt,
-            'aspect_ratio': aspect_ratio,
-            'posters': poster_data,
-            'timestamp': datetime.now().isoformat()
-        })
-        save_history()
+        try:
+            job_id = submit_generation(prompt, aspect_ratio, fanout=parse_fanout(data), enhanced_prompt=data.get('enhanced_prompt', ''))
+        except QueueFull as e:
+            return queue_full_response(e)
 
-        return jsonify({'posters': poster_data})
+        if run_async:
+            return jsonify(job_json(job_manager.get(job_id))), 202
+
+        job = job_manager.wait(job_id)
+        if job['status'] != 'done':
+            return jsonify({'error': job['error'] or 'Failed to generate posters'}), 500
+        return jsonify({'posters': job_json(job)['posters']})
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    if request.content_type and request.content_type.startswith('multipart/form-data'):
+        data = request.form
+    else:
+        data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Request body must be a JSON object'}), 400
+    prompt = str(data.get('prompt') or '').strip()
+    if not prompt:
+        return jsonify({'error': 'Prompt is required'}), 400
+    try:
+        job_id = submit_generation(prompt, data.get('aspect_ratio', '9:16'), request.files.get('logo'), data.get('logo_position', 'top-left'), parse_fanout(data), data.get('enhanced_prompt', ''))
+    except QueueFull as e:
+        return queue_full_response(e)
+    return jsonify(job_json(job_manager.get(job_id))), 202
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job_json(job))
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    if job_manager.get(job_id) is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    # Server-Sent Events: one event named after the job status per change. A
+    # failed job is sent as "failed": "error" is EventSource's own event for a
+    # dropped connection, which the browser retries by itself.
+    def stream():
+        for job in job_manager.events(job_id):
+            event = 'failed' if job['status'] == 'error' else job['status']
+            yield f"event: {event}\ndata: {json.dumps(job_json(job))}\n\n"
+    response = Response(stream_with_context(stream()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/batches', methods=['POST'])
+def create_batch():
+    # The manifest is the JSON body, or a .json/.csv file upload ('manifest')
+    # with an optional shared 'logo' and defaults as form fields.
+    try:
+        if request.content_type and request.content_type.startswith('multipart/form-data'):
+            manifest = request.files.get('manifest')
+            if not manifest or not manifest.filename:
+                return jsonify({'error': 'Manifest file is required'}), 400
+            rows, defaults = parse_manifest(manifest.read(), manifest.filename)
+            defaults = dict({k: v for k, v in request.form.items() if v}, **defaults)
+        else:
+            rows, defaults = parse_manifest(request.get_json(silent=True))
+        items, duplicates = expand_manifest(rows, defaults, backends.ASPECT_RATIO_SIZES, LOGO_POSITIONS)
+    except (ValueError, TypeError) as e:
+        return jsonify({'error': str(e)}), 400
+    logo_file = request.files.get('logo')
+    logo_hash = image_store.put_image(logo_file.read()) if logo_file and logo_file.filename else None
+    output_format = image_pipeline.negotiate_format(request.accept_mimetypes)
+    for item in items:
+        item.update(logo_hash=logo_hash, output_format=output_format)
+    batch_id = batch_manager.create(items, duplicates)
+    return jsonify(batch_json(batch_manager.get(batch_id))), 202
+
+@app.route('/batches/<batch_id>')
+def batch_status_route(batch_id):
+    batch = batch_manager.get(batch_id)
+    if batch is None:
+        return jsonify({'error': 'Unknown batch'}), 404
+    return jsonify(batch_json(batch))
+
+@app.route('/batches/<batch_id>/resume', methods=['POST'])
+def resume_batch(batch_id):
+    # Re-runs failed or interrupted items; finished items are kept
+    requeued = batch_manager.resume(batch_id)
+    if requeued is None:
+        return jsonify({'error': 'Unknown batch'}), 404
+    return jsonify(dict(batch_json(batch_manager.get(batch_id)), requeued=requeued)), 202
+
+@app.route('/batches/<batch_id>/download')
+def download_batch(batch_id):
+    if batch_manager.get(batch_id) is None:
+        return jsonify({'error': 'Unknown batch'}), 404
+    # Streamed while it is built: finished posters go out right away and, with
+    # follow=1 (the default), posters still being generated follow as they finish.
+    follow = request.args.get('follow', '1') != '0'
+    stream = stream_zip(lambda: batch_manager.get(batch_id), image_store.read_image, follow=follow)
+    response = Response(stream_with_context(stream), mimetype='application/zip')
+    response.headers['Content-Disposition'] = f'attachment; filename=batch-{batch_id}.zip'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+# Composites already produced for a (poster, logo, position, scale) combination
+overlay_cache = TwoTierCache()
+
 @app.route('/overlay-logo', methods=['POST'])
 def overlay_logo_route():
     try:
-        # This would handle logo overlay functionality
-        # Implementation depends on how you want to handle the logo upload and positioning
-        return jsonify({'message': 'Not implemented'}), 501
+        # Re-position a logo on an already generated poster without regenerating it.
+        # image_id: poster hash (use base_hash for posters that already carry a logo)
+        # logo (file) or logo_id: the logo; position (named) or x/y in poster pixels; scale
+        if request.content_type and request.content_type.startswith('multipart/form-data'):
+            data = request.form
+        else:
+            data = request.get_json(silent=True) or {}
+        image_id = data.get('image_id', '')
+        if not image_store.has_image(image_id):
+            return jsonify({'error': 'Unknown image'}), 404
+        logo_file = request.files.get('logo')
+        if logo_file and logo_file.filename:
+            logo_id = image_store.put_image(logo_file.read())
+        else:
+            logo_id = data.get('logo_id', '')
+        if not image_store.has_image(logo_id):
+            return jsonify({'error': 'Logo is required'}), 400
+        if data.get('x') is not None and data.get('y') is not None:
+            position = [int(data.get('x')), int(data.get('y'))]
+        else:
+            position = data.get('position', 'top-left')
+            if position not in LOGO_POSITIONS:
+                return jsonify({'error': f'position must be one of {", ".join(LOGO_POSITIONS)}'}), 400
+        scale = min(max(float(data.get('scale', DEFAULT_LOGO_SCALE)), 0.01), 1.0)
+
+        output_format = image_pipeline.negotiate_format(request.accept_mimetypes)
+        key = json.dumps([image_id, logo_id, position, scale, output_format])
+        result = overlay_cache.get('overlay', '', key)
+        cached = result is not None
+        if not cached:
+            poster = SourceImage(image_store.read_image(image_id)).decode()
+            overlay_logo(poster, logo_id, position, scale)
+            result = store_poster(poster, 0, output_format)
+            del result['id']
+            overlay_cache.set('overlay', '', key, result)
+        return jsonify(dict(result, image_id=image_id, logo_id=logo_id, cached=cached,
+                            url=url_for('serve_image', image_hash=result['hash'])))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/metrics')
+def metrics_endpoint():
+    if not metrics.METRICS_ENABLED:
+        abort(404)
+    return Response(metrics.expose(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/cache-stats')
+def cache_stats():
+    return jsonify(dict(prompt_cache.stats(), imagen=image_backend.stats(), overlay=overlay_cache.stats()))
+
 @app.route('/regen-suggestions', methods=['POST'])
 def regen_suggestions():
     try:
@@ -368,78 +760,11 @@ def regen_suggestions():
         enhanced_prompt = data.get('enhanced_prompt', '').strip()
         if not enhanced_prompt:
             return jsonify({'error': 'Enhanced prompt required'}), 400
-        client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY"))
-        model = "gemini-2.0-flash-001"
-        # Suggest objects
-        objects_prompt = f"""
-Given the following enhanced poster prompt, suggest a list of 5-8 distinct visual objects, motifs, or elements that would be visually compelling and relevant for the poster. Return only a JSON array of short object names or phrases, nothing else.\n\nPrompt:\n{enhanced_prompt}
-"""
-        color_prompt = f"""
-Given the following enhanced poster prompt, suggest 3-5 harmonious color combinations (each as a short descriptive phrase, e.g., 'emerald green and brushed gold', 'deep ocean blue and bright coral'). Return only a JSON array of color combination strings, nothing else.\n\nPrompt:\n{enhanced_prompt}
-"""
-        # Get objects
-        objects_contents = [types.Content(role="user", parts=[types.Part(text=objects_prompt)])]
-        color_contents = [types.Content(role="user", parts=[types.Part(text=color_prompt)])]
-        generate_config = types.GenerateContentConfig(
-            thinking_config=types.ThinkingConfig(),
-            response_mime_type="text/plain"
-        )
-        # Objects
-        objects_response = ""
-        for chunk in client.models.generate_content_stream(
-            model=model,
-            contents=objects_contents,
-            config=generate_config
-        ):
-            if hasattr(chunk, 'text') and chunk.text:
-                objects_response += chunk.text
-        import json as _json
-        try:
-            objects = _json.loads(objects_response)
-            if not isinstance(objects, list):
-                objects = [str(objects)]
-        except Exception:
-            objects = []
-        # Colors
-        colors_response = ""
-        for chunk in client.models.generate_content_stream(
-            model=model,
-            contents=color_contents,
-            config=generate_config
-        ):
-            if hasattr(chunk, 'text') and chunk.text:
-                colors_response += chunk.text
-        try:
-            color_combinations = _json.loads(colors_response)
-            if not isinstance(color_combinations, list):
-                color_combinations = [str(color_combinations)]
-        except Exception:
-            color_combinations = []
+        objects, color_combinations = suggestions.suggest(enhanced_prompt, fresh=bool(data.get('fresh')))
         return jsonify({'objects': objects, 'color_combinations': color_combinations})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-def extract_key_features(enhanced_prompt):
-    # Simple regex-based extraction for demo purposes
-    features = {
-        'title': '',
-        'visual_style': '',
-        'color_scheme': '',
-        'typography': '',
-        'graphic_elements': '',
-        'background': '',
-        'audience': '',
-        'purpose': '',
-        'tone': '',
-    }
-    # Try to extract each feature from the enhanced prompt
-    for key in features:
-        pattern = re.compile(rf'{key.replace("_", " ").title()}:\s*(.*?)(?:\.|$)', re.IGNORECASE)
-        match = pattern.search(enhanced_prompt)
-        if match:
-            features[key] = match.group(1).strip()
-    return features
-
 @app.route('/extract-features', methods=['POST'])
 def extract_features():
     try:
@@ -447,10 +772,56 @@ def extract_features():
         enhanced_prompt = data.get('enhanced_prompt', '')
         if not enhanced_prompt:
             return jsonify({'error': 'Enhanced prompt required'}), 400
-        features = extract_key_features(enhanced_prompt)
+        # Features that came with a structured enhancement are preferred to the regex guesses
+        features = (concept.STRUCTURED_ENABLED and concept.cached_features(enhanced_prompt)) \
+            or extract_key_features(enhanced_prompt)
         return jsonify({'features': features})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# --- Startup ---
+# Heavy libraries (google-genai, Pillow) are imported on first use, so
+# importing the app is cheap and the first request that needs one pays for
+# it. Pre-fork servers can call warm_up() once in the master instead, so
+# every worker starts with them already loaded. Import time, warm-up time and
+# import-to-first-response latency are exported on /metrics as
+# poster_startup_seconds.
+metrics.startup_seconds.set('import', time.perf_counter() - _import_started)
+_awaiting_first_response = True
+
+@app.after_request
+def record_first_response(response):
+    global _awaiting_first_response
+    if _awaiting_first_response:
+        _awaiting_first_response = False
+        metrics.startup_seconds.set('first_response', time.perf_counter() - _import_started)
+    return response
+
+def warm_up():
+    """Load everything the first requests would otherwise wait for.
+
+    Safe to run before forking: it only imports modules and fills in-memory
+    caches, and opens no connections, files or threads.
+    """
+    started = time.perf_counter()
+    import google.genai.types  # noqa: F401
+    from PIL import Image, ImageDraw  # noqa: F401
+    image_pipeline.supported_formats()
+    derivatives.derivative_format()
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    metrics.startup_seconds.set('warm_up', time.perf_counter() - started)
+
+def create_app(config=None):
+    """Application factory, e.g. `gunicorn --preload 'app:create_app()'`.
+
+    Runs warm_up() first when POSTER_WARM_UP=1 or config WARM_UP is set.
+    """
+    if config:
+        app.config.update(config)
+    if app.config.get('WARM_UP', os.environ.get('POSTER_WARM_UP') == '1'):
+        warm_up()
+    return app
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,78 @@
+import os
+import random
+import time
+from io import BytesIO
+
+import genai_client
+
+# --- Image generation backends ---
+# generate_poster() talks to whichever backend POSTER_IMAGE_BACKEND selects.
+# Each backend returns the raw encoded images it got for a prompt, so the
+# rest of the pipeline (overlay, storage, jobs) can run offline against the
+# fake one.
+IMAGEN_MODEL = "models/imagen-4.0-generate-preview-06-06"
+
+# Output sizes Imagen 4 produces for each supported aspect ratio.
+ASPECT_RATIO_SIZES = {
+    '1:1': (1024, 1024),
+    '3:4': (896, 1280),
+    '4:3': (1280, 896),
+    '9:16': (768, 1408),
+    '16:9': (1408, 768),
+}
+
+
+class ImagenBackend:
+    def generate(self, prompt, aspect_ratio, number_of_images=3):
+        result = genai_client.generate_images(
+            IMAGEN_MODEL,
+            prompt,
+            dict(
+                number_of_images=number_of_images,
+                output_mime_type="image/jpeg",
+                person_generation="ALLOW_ADULT",
+                aspect_ratio=aspect_ratio,
+            ),
+        )
+        if not result.generated_images:
+            return []
+        return [img.image.image_bytes for img in result.generated_images]
+
+
+class FakeImagenBackend:
+    """Offline stand-in for Imagen: solid-color JPEGs of the right size.
+
+    ``latency`` seconds are slept per call and ``error_rate`` is the chance
+    a call raises, so queueing and failure paths can be exercised.
+    """
+
+    def __init__(self, latency=0.0, error_rate=0.0):
+        self.latency = latency
+        self.error_rate = error_rate
+
+    def generate(self, prompt, aspect_ratio, number_of_images=3):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.error_rate and random.random() < self.error_rate:
+            raise RuntimeError('Fake Imagen error')
+        from PIL import Image, ImageDraw
+        size = ASPECT_RATIO_SIZES.get(aspect_ratio, ASPECT_RATIO_SIZES['1:1'])
+        images = []
+        for i in range(number_of_images):
+            color = tuple(random.randrange(256) for _ in range(3))
+            img = Image.new('RGB', size, color)
+            ImageDraw.Draw(img).text((20, 20), f'{prompt[:40]} #{i}', fill=(255, 255, 255))
+            buffered = BytesIO()
+            img.save(buffered, format='JPEG', quality=85)
+            images.append(buffered.getvalue())
+        return images
+
+
+def get_backend():
+    name = os.environ.get('POSTER_IMAGE_BACKEND', 'imagen')
+    if name == 'fake':
+        return FakeImagenBackend(
+            latency=float(os.environ.get('FAKE_IMAGEN_LATENCY', '0')),
+            error_rate=float(os.environ.get('FAKE_IMAGEN_ERROR_RATE', '0')),
+        )
+    return ImagenBackend()
@@ -0,0 +1,353 @@
+import csv
+import io
+import json
+import os
+import re
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from db import Database
+from jobs import QUEUED, RUNNING, DONE, ERROR, FINISHED
+
+# --- Batch generation ---
+# A batch is a manifest of prompts x aspect ratios x logo placements. Each
+# distinct combination becomes one item; items run on a pool of
+# BATCH_CONCURRENCY workers shared by all batches, so a large campaign cannot
+# take over the interactive job pool or exceed the upstream quota (the GenAI
+# client's rate limits apply on top). Item state is stored in SQLite, so a
+# batch can be inspected from any worker process, and failed or interrupted
+# items can be resumed without redoing the finished ones.
+#
+# The process that queues an item holds a lease on it, renewed while the item
+# waits or runs. A resume, from whichever worker it reaches, only takes over
+# items whose lease has expired, so work still owned by a live process is
+# never run twice.
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', '2'))
+BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', '200'))
+BATCH_IMAGES_PER_ITEM = int(os.environ.get('BATCH_IMAGES_PER_ITEM', '1'))
+BATCH_LEASE_SECONDS = float(os.environ.get('BATCH_LEASE_SECONDS', '60'))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS batches (
+    id TEXT PRIMARY KEY,
+    created REAL NOT NULL,
+    duplicates INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS batch_items (
+    batch_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    updated REAL NOT NULL,
+    result TEXT,
+    error TEXT,
+    lease_until REAL,
+    PRIMARY KEY (batch_id, position)
+);
+"""
+
+ITEM_FIELDS = ('prompt', 'aspect_ratio', 'logo_position', 'enhance', 'images')
+
+
+def _as_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'y')
+
+
+def _split(value):
+    # "9:16;1:1" or ["9:16", "1:1"] -> ['9:16', '1:1']
+    if isinstance(value, (list, tuple)):
+        return [str(v).strip() for v in value if str(v).strip()]
+    return [v.strip() for v in re.split(r'[;|]', str(value or '')) if v.strip()]
+
+
+def parse_manifest(data, filename=''):
+    """Read a JSON or CSV manifest into a list of row dicts.
+
+    JSON is either a list of rows or {"items": [...], <defaults>}; CSV has a
+    header row. Rows name a ``prompt`` and optionally ``aspect_ratio`` (or
+    ``aspect_ratios``, several separated by ';'), ``logo_position``,
+    ``enhance`` and ``images``. Returns (rows, defaults).
+    """
+    if isinstance(data, bytes):
+        data = data.decode('utf-8-sig')
+    if isinstance(data, str):
+        if filename.lower().endswith('.csv') or not data.lstrip().startswith(('[', '{')):
+            return list(csv.DictReader(io.StringIO(data))), {}
+        data = json.loads(data)
+    if isinstance(data, dict):
+        defaults = {k: v for k, v in data.items() if k != 'items'}
+        return list(data.get('items') or []), defaults
+    if isinstance(data, list):
+        return data, {}
+    raise ValueError('Manifest must be a JSON list, a JSON object with "items", or CSV')
+
+
+def expand_manifest(rows, defaults, aspect_ratios, logo_positions):
+    """Turn manifest rows into distinct items; returns (items, duplicates)."""
+    items, seen, duplicates = [], set(), 0
+    for n, row in enumerate(rows, 1):
+        if isinstance(row, str):
+            row = {'prompt': row}
+        if not isinstance(row, dict):
+            raise ValueError(f'Row {n}: must be an object or a prompt string')
+        merged = dict(defaults, **{k: v for k, v in row.items() if v not in (None, '')})
+        prompt = ' '.join(str(merged.get('prompt', '')).split())
+        if not prompt:
+            raise ValueError(f'Row {n}: prompt is required')
+        ratios = _split(merged.get('aspect_ratios') or merged.get('aspect_ratio') or '9:16')
+        positions = _split(merged.get('logo_positions') or merged.get('logo_position') or 'top-left')
+        for ratio in ratios:
+            if ratio not in aspect_ratios:
+                raise ValueError(f'Row {n}: unsupported aspect ratio {ratio}')
+            for position in positions:
+                if position not in logo_positions:
+                    raise ValueError(f'Row {n}: unsupported logo position {position}')
+                item = {
+                    'prompt': prompt,
+                    'aspect_ratio': ratio,
+                    'logo_position': position,
+                    'enhance': _as_bool(merged.get('enhance', True)),
+                    'images': max(1, min(int(merged.get('images', BATCH_IMAGES_PER_ITEM)), 4)),
+                }
+                key = tuple(item[f] for f in ITEM_FIELDS)
+                if key in seen:
+                    duplicates += 1
+                    continue
+                seen.add(key)
+                items.append(item)
+    if not items:
+        raise ValueError('Manifest has no items')
+    if len(items) > BATCH_MAX_ITEMS:
+        raise ValueError(f'Manifest expands to {len(items)} items; the limit is {BATCH_MAX_ITEMS}')
+    return items, duplicates
+
+
+class BatchStore(Database):
+    schema = SCHEMA
+
+    def _setup(self, conn):
+        super()._setup(conn)
+        # Tables created before item leases existed
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(batch_items)')}
+        if 'lease_until' not in columns:
+            conn.execute('ALTER TABLE batch_items ADD COLUMN lease_until REAL')
+
+    def create(self, batch_id, items, duplicates, lease_seconds=BATCH_LEASE_SECONDS):
+        now = time.time()
+        conn = self._connect()
+        with self._write(conn):
+            conn.execute('INSERT INTO batches (id, created, duplicates) VALUES (?, ?, ?)',
+                         (batch_id, now, duplicates))
+            conn.executemany(
+                'INSERT INTO batch_items (batch_id, position, params, status, updated, lease_until)'
+                ' VALUES (?, ?, ?, ?, ?, ?)',
+                [(batch_id, i, json.dumps(item), QUEUED, now, now + lease_seconds) for i, item in enumerate(items)],
+            )
+
+    def update_item(self, batch_id, position, status, result=None, error=None):
+        # A finished item gives up its lease, so a failed one can be resumed right away
+        conn = self._connect()
+        with self._write(conn):
+            conn.execute(
+                'UPDATE batch_items SET status = ?, result = ?, error = ?, updated = ?,'
+                ' attempts = attempts + ?, lease_until = CASE WHEN ? THEN NULL ELSE lease_until END'
+                ' WHERE batch_id = ? AND position = ?',
+                (status, json.dumps(result) if result is not None else None, error, time.time(),
+                 1 if status == RUNNING else 0, status in FINISHED, batch_id, position),
+            )
+
+    def claim_stale(self, batch_id, lease_seconds=BATCH_LEASE_SECONDS):
+        """Requeue the unfinished items whose lease has expired, taking a new
+        lease on them; returns their (position, params) pairs."""
+        now = time.time()
+        conn = self._connect()
+        with self._write(conn):
+            rows = conn.execute(
+                'SELECT position, params FROM batch_items WHERE batch_id = ? AND status != ?'
+                ' AND (lease_until IS NULL OR lease_until < ?) ORDER BY position',
+                (batch_id, DONE, now),
+            ).fetchall()
+            conn.executemany(
+                'UPDATE batch_items SET status = ?, error = NULL, updated = ?, lease_until = ?'
+                ' WHERE batch_id = ? AND position = ?',
+                [(QUEUED, now, now + lease_seconds, batch_id, position) for position, _ in rows],
+            )
+        return [(position, json.loads(params)) for position, params in rows]
+
+    def renew_leases(self, keys, lease_seconds=BATCH_LEASE_SECONDS):
+        conn = self._connect()
+        with self._write(conn):
+            conn.executemany(
+                'UPDATE batch_items SET lease_until = ? WHERE batch_id = ? AND position = ? AND status NOT IN (?, ?)',
+                [(time.time() + lease_seconds, batch_id, position) + FINISHED for batch_id, position in keys],
+            )
+
+    def get(self, batch_id):
+        conn = self._connect()
+        row = conn.execute('SELECT created, duplicates FROM batches WHERE id = ?', (batch_id,)).fetchone()
+        if row is None:
+            return None
+        items = [{
+            'position': position,
+            'params': json.loads(params),
+            'status': status,
+            'attempts': attempts,
+            'result': json.loads(result) if result else None,
+            'error': error,
+        } for position, params, status, attempts, result, error in conn.execute(
+            'SELECT position, params, status, attempts, result, error FROM batch_items'
+            ' WHERE batch_id = ? ORDER BY position', (batch_id,))]
+        return {'id': batch_id, 'created': row[0], 'duplicates': row[1], 'items': items}
+
+
+def batch_status(batch):
+    statuses = {item['status'] for item in batch['items']}
+    if statuses <= {DONE}:
+        return DONE
+    if statuses <= set(FINISHED):
+        return ERROR if DONE not in statuses else 'partial'
+    return RUNNING if statuses & {RUNNING, DONE, ERROR} else QUEUED
+
+
+class BatchManager:
+    """Runs batch items on a bounded pool with ``runner(item_params)``."""
+
+    def __init__(self, runner, store, max_workers=BATCH_CONCURRENCY, lease_seconds=BATCH_LEASE_SECONDS):
+        self.runner = runner
+        self.store = store
+        self.lease_seconds = lease_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='batch')
+        self._lock = threading.Lock()
+        self._in_flight = set()
+        self._renewer_pid = None
+
+    def create(self, items, duplicates):
+        batch_id = uuid.uuid4().hex
+        self.store.create(batch_id, items, duplicates, self.lease_seconds)
+        for position, item in enumerate(items):
+            self._submit(batch_id, position, item)
+        return batch_id
+
+    def resume(self, batch_id):
+        """Re-run failed items, and items left unfinished by a process that
+        went away; returns how many were queued again."""
+        if self.store.get(batch_id) is None:
+            return None
+        stale = self.store.claim_stale(batch_id, self.lease_seconds)
+        for position, params in stale:
+            self._submit(batch_id, position, params)
+        return len(stale)
+
+    def _submit(self, batch_id, position, params):
+        with self._lock:
+            if (batch_id, position) in self._in_flight:
+                return
+            self._in_flight.add((batch_id, position))
+            if self._renewer_pid != os.getpid():
+                # One renewal thread per process, started after any fork
+                self._renewer_pid = os.getpid()
+                threading.Thread(target=self._renew_leases, name='batch-leases', daemon=True).start()
+        self._executor.submit(metrics.bind(self._run), batch_id, position, params)
+
+    def _renew_leases(self):
+        while True:
+            time.sleep(self.lease_seconds / 3)
+            with self._lock:
+                keys = list(self._in_flight)
+            if keys:
+                try:
+                    self.store.renew_leases(keys, self.lease_seconds)
+                except Exception:
+                    pass
+
+    def _run(self, batch_id, position, params):
+        try:
+            self.store.update_item(batch_id, position, RUNNING)
+            with metrics.timed('batch_item'):
+                result = self.runner(params)
+            self.store.update_item(batch_id, position, DONE, result=result)
+        except Exception as e:
+            self.store.update_item(batch_id, position, ERROR, error=str(e))
+        finally:
+            with self._lock:
+                self._in_flight.discard((batch_id, position))
+
+    def get(self, batch_id):
+        return self.store.get(batch_id)
+
+
+# --- Streamed ZIP export ---
+class _ZipStream:
+    """Write-only sink for ZipFile; the bytes written so far are taken with drain()."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _slug(text, length=40):
+    return re.sub(r'[^a-z0-9]+', '-', text.lower()).strip('-')[:length].rstrip('-') or 'poster'
+
+
+def poster_filename(item, index, poster):
+    params = item['params']
+    ext = {'jpeg': 'jpg'}.get(poster.get('format'), poster.get('format') or 'jpg')
+    return (f"{item['position'] + 1:03d}-{_slug(params['prompt'])}-"
+            f"{params['aspect_ratio'].replace(':', 'x')}-{params['logo_position']}-{index + 1}.{ext}")
+
+
+def stream_zip(load_batch, read_file, follow=True, poll_interval=1.0, timeout=3600):
+    """Yield a ZIP of a batch's posters piece by piece.
+
+    Posters are read from disk one at a time and stored uncompressed (they
+    are already compressed images), so memory use does not grow with the
+    batch. With ``follow``, items still running are added as they finish.
+    A manifest.csv with every item's status closes the archive.
+    """
+    sink = _ZipStream()
+    written = set()
+    deadline = time.monotonic() + timeout
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED) as archive:
+        while True:
+            batch = load_batch()
+            for item in batch['items']:
+                if item['status'] != DONE or item['position'] in written:
+                    continue
+                written.add(item['position'])
+                for index, poster in enumerate(item['result']['posters']):
+                    with archive.open(poster_filename(item, index, poster), 'w') as f:
+                        f.write(read_file(poster['hash']))
+                    yield sink.drain()
+            pending = [item for item in batch['items'] if item['status'] not in FINISHED]
+            if not follow or not pending or time.monotonic() > deadline:
+                break
+            time.sleep(poll_interval)
+        manifest = io.StringIO()
+        writer = csv.writer(manifest)
+        writer.writerow(['position', 'prompt', 'aspect_ratio', 'logo_position', 'status', 'error', 'files'])
+        for item in batch['items']:
+            files = [poster_filename(item, i, p) for i, p in enumerate((item['result'] or {}).get('posters', []))] \
+                if item['position'] in written else []
+            params = item['params']
+            writer.writerow([item['position'] + 1, params['prompt'], params['aspect_ratio'], params['logo_position'],
+                             item['status'], item['error'] or '', ' '.join(files)])
+        archive.writestr('manifest.csv', manifest.getvalue())
+    yield sink.drain()
@@ -0,0 +1,180 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict, defaultdict
+
+from db import Database
+
+# --- Two-tier text cache ---
+# Gemini results (enhanced prompts, object and color suggestions) are cached
+# by kind + model + normalized input text. Lookups hit an in-process LRU first
+# and fall back to a SQLite tier shared by all workers that survives restarts.
+# Both tiers expire entries after a TTL; the disk tier is also trimmed to a
+# byte budget, least recently used first.
+CACHE_DB = os.environ.get('POSTER_CACHE_DB', 'poster_cache.db')
+CACHE_MEMORY_ITEMS = int(os.environ.get('CACHE_MEMORY_ITEMS', '1024'))
+CACHE_DISK_BYTES = int(os.environ.get('CACHE_DISK_BYTES', str(64 * 1024 * 1024)))
+CACHE_TTL_SECONDS = float(os.environ.get('CACHE_TTL_SECONDS', str(7 * 24 * 60 * 60)))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    expires REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cache_accessed ON cache(accessed);
+"""
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_text(text):
+    # Resubmissions that differ only in spacing or Unicode form share an entry.
+    return _WHITESPACE.sub(' ', unicodedata.normalize('NFKC', text)).strip()
+
+
+def make_key(kind, model, text):
+    return hashlib.sha256(f'{kind}\0{model}\0{normalize_text(text)}'.encode('utf-8')).hexdigest()
+
+
+class DiskTier(Database):
+    schema = SCHEMA
+
+    def __init__(self, path, max_bytes, ttl):
+        super().__init__(path)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+    def get(self, key):
+        """Return (value, expires), or (None, None) on a miss."""
+        now = time.time()
+        conn = self._connect()
+        row = conn.execute('SELECT value, expires FROM cache WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None, None
+        if row[1] < now:
+            with self._write(conn):
+                conn.execute('DELETE FROM cache WHERE key = ?', (key,))
+            return None, None
+        with self._write(conn):
+            conn.execute('UPDATE cache SET accessed = ? WHERE key = ?', (now, key))
+        return json.loads(row[0]), row[1]
+
+    def set(self, key, value):
+        now = time.time()
+        data = json.dumps(value, ensure_ascii=False)
+        conn = self._connect()
+        with self._write(conn):
+            conn.execute(
+                'INSERT OR REPLACE INTO cache (key, value, size, expires, accessed) VALUES (?, ?, ?, ?, ?)',
+                (key, data, len(data), now + self.ttl, now),
+            )
+            return self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        evicted = conn.execute('DELETE FROM cache WHERE expires < ?', (now,)).rowcount
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM cache').fetchone()[0]
+        if total <= self.max_bytes:
+            return evicted
+        for key, size in conn.execute('SELECT key, size FROM cache ORDER BY accessed').fetchall():
+            conn.execute('DELETE FROM cache WHERE key = ?', (key,))
+            evicted += 1
+            total -= size
+            if total <= self.max_bytes:
+                break
+        return evicted
+
+
+class TwoTierCache:
+    def __init__(self, path=CACHE_DB, memory_items=CACHE_MEMORY_ITEMS, disk_bytes=CACHE_DISK_BYTES, ttl=CACHE_TTL_SECONDS):
+        self.memory_items = memory_items
+        self.ttl = ttl
+        self.disk = DiskTier(path, disk_bytes, ttl)
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = defaultdict(lambda: defaultdict(int))
+
+    def _count(self, kind, counter, n=1):
+        with self._lock:
+            self._stats[kind][counter] += n
+
+    def _memory_get(self, key):
+        with self._lock:
+            item = self._memory.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            return value
+
+    def _memory_set(self, key, value, ttl=None):
+        with self._lock:
+            self._memory[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+                self._stats['memory']['evictions'] += 1
+
+    def get(self, kind, model, text):
+        key = make_key(kind, model, text)
+        value = self._memory_get(key)
+        if value is not None:
+            self._count(kind, 'memory_hits')
+            return value
+        try:
+            value, expires = self.disk.get(key)
+        except Exception:
+            value = None
+        if value is not None:
+            self._count(kind, 'disk_hits')
+            # Promoted entries keep the lifetime they have left on disk
+            self._memory_set(key, value, ttl=expires - time.time())
+            return value
+        self._count(kind, 'misses')
+        return None
+
+    def set(self, kind, model, text, value):
+        key = make_key(kind, model, text)
+        self._memory_set(key, value)
+        try:
+            self._count('disk', 'evictions', self.disk.set(key, value))
+        except Exception:
+            pass
+
+    def bypass(self, kind):
+        self._count(kind, 'bypassed')
+
+    def get_or_compute(self, kind, model, text, compute, fresh=False):
+        """Return the cached value, or compute and cache it.
+
+        ``fresh`` skips the lookup (the new result still replaces the cached
+        one). Empty results are not cached, so failures are retried next time.
+        """
+        if fresh:
+            self.bypass(kind)
+        else:
+            value = self.get(kind, model, text)
+            if value is not None:
+                return value
+        value = compute()
+        if value:
+            self.set(kind, model, text, value)
+        return value
+
+    def stats(self):
+        with self._lock:
+            stats = {kind: dict(counters) for kind, counters in self._stats.items()}
+            stats.setdefault('memory', {})['size'] = len(self._memory)
+        return stats
+
+
+prompt_cache = TwoTierCache()
@@ -0,0 +1,98 @@
+import os
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+import image_store
+import metrics
+
+# --- Logo compositing ---
+# Logos are referenced by their image-store hash. Each logo is decoded once
+# and each (logo, width) variant is resized once; both are kept in small LRU
+# caches so a batch of posters, or repeated repositioning of the same logo,
+# never re-decodes or re-scales it. Compositing pastes into the poster in
+# place, touching only the logo's region.
+LOGO_CACHE_ITEMS = int(os.environ.get('LOGO_CACHE_ITEMS', '64'))
+DEFAULT_LOGO_SCALE = 0.18
+LOGO_MARGIN = 0.03
+LOGO_POSITIONS = ('top-left', 'top-right', 'bottom-left', 'bottom-right', 'center')
+
+
+class _LRU:
+    def __init__(self, max_items):
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+
+_decoded = _LRU(LOGO_CACHE_ITEMS)
+_scaled = _LRU(LOGO_CACHE_ITEMS * 4)
+
+
+def decoded_logo(logo_hash):
+    logo = _decoded.get(logo_hash)
+    if logo is None:
+        from PIL import Image
+        logo = Image.open(BytesIO(image_store.read_image(logo_hash))).convert("RGBA")
+        logo.load()
+        _decoded.put(logo_hash, logo)
+    return logo
+
+
+def scaled_logo(logo_hash, width):
+    key = (logo_hash, width)
+    logo = _scaled.get(key)
+    if logo is None:
+        source = decoded_logo(logo_hash)
+        logo = source.resize((width, max(1, int(source.height * (width / source.width)))))
+        _scaled.put(key, logo)
+    return logo
+
+
+def logo_width(poster, scale):
+    return max(1, int(poster.width * scale))
+
+
+def logo_xy(pos, poster_size, logo_size):
+    """Top-left corner for a named position, or pass through an (x, y) pair."""
+    w, h = poster_size
+    lw, lh = logo_size
+    if isinstance(pos, (tuple, list)):
+        x, y = pos
+    elif pos == 'top-right':
+        x, y = w - lw - int(w*LOGO_MARGIN), int(h*LOGO_MARGIN)
+    elif pos == 'bottom-left':
+        x, y = int(w*LOGO_MARGIN), h - lh - int(h*LOGO_MARGIN)
+    elif pos == 'bottom-right':
+        x, y = w - lw - int(w*LOGO_MARGIN), h - lh - int(h*LOGO_MARGIN)
+    elif pos == 'center':
+        x, y = (w - lw)//2, (h - lh)//2
+    else:
+        x, y = int(w*LOGO_MARGIN), int(h*LOGO_MARGIN)
+    # Keep the logo on the poster.
+    return (min(max(0, int(x)), max(0, w - lw)), min(max(0, int(y)), max(0, h - lh)))
+
+
+def overlay_logo(poster, logo_hash, position, scale=DEFAULT_LOGO_SCALE):
+    """Paste the logo onto ``poster`` in place and return it.
+
+    ``position`` is one of LOGO_POSITIONS or an (x, y) pair in poster pixels.
+    """
+    with metrics.timed('overlay'):
+        logo = scaled_logo(logo_hash, logo_width(poster, scale))
+        poster.paste(logo, logo_xy(position, poster.size, logo.size), logo)
+        return poster
@@ -0,0 +1,80 @@
+import json
+import os
+
+from cache import prompt_cache
+from prompt_features import FEATURE_KEYS
+from suggestions import SUGGESTION_MODEL
+
+# --- Structured enhancement ---
+# With GEMINI_STRUCTURED=1 one Gemini call with a JSON response schema returns
+# the enhanced prompt together with the object suggestions, the color
+# combinations and the key features, instead of up to four separate calls.
+# The parsed parts are stored in the prompt cache under the enhanced prompt,
+# which the follow-up requests (/regen-suggestions, /extract-features) send
+# back, so they are answered without going upstream again.
+STRUCTURED_ENABLED = os.environ.get('GEMINI_STRUCTURED', '0') == '1'
+
+CONCEPT_OUTPUT = """
+Respond with a JSON object instead of a plain string:
+- enhanced_prompt: the complete poster prompt described above.
+- objects: 5-8 distinct visual objects, motifs, or elements that would be visually compelling and relevant for the poster, as short names or phrases.
+- color_combinations: 3-5 harmonious color combinations, each as a short descriptive phrase (e.g., 'emerald green and brushed gold').
+- features: the title, visual style, color scheme, typography, graphic elements, background, audience, purpose and tone of the enhanced prompt, each as a short phrase.
+"""
+
+_STRING = {'type': 'STRING'}
+_STRING_LIST = {'type': 'ARRAY', 'items': _STRING}
+CONCEPT_SCHEMA = {
+    'type': 'OBJECT',
+    'properties': {
+        'enhanced_prompt': _STRING,
+        'objects': _STRING_LIST,
+        'color_combinations': _STRING_LIST,
+        'features': {
+            'type': 'OBJECT',
+            'properties': {key: _STRING for key in FEATURE_KEYS},
+            'required': list(FEATURE_KEYS),
+        },
+    },
+    'required': ['enhanced_prompt', 'objects', 'color_combinations', 'features'],
+    'property_ordering': ['enhanced_prompt', 'objects', 'color_combinations', 'features'],
+}
+
+
+def _strings(value):
+    if not isinstance(value, list):
+        return []
+    return [item.strip() for item in value if isinstance(item, str) and item.strip()]
+
+
+def parse_concept(text):
+    """Validate a structured response; raises ValueError if it has no usable
+    enhanced prompt. Missing lists and features come back empty."""
+    try:
+        data = json.loads(text)
+    except ValueError:
+        raise ValueError('Structured response is not valid JSON')
+    if not isinstance(data, dict) or not isinstance(data.get('enhanced_prompt'), str) \
+            or not data['enhanced_prompt'].strip():
+        raise ValueError('Structured response has no enhanced prompt')
+    features = data.get('features') if isinstance(data.get('features'), dict) else {}
+    return {
+        'enhanced_prompt': data['enhanced_prompt'].strip(),
+        'objects': _strings(data.get('objects')),
+        'color_combinations': _strings(data.get('color_combinations')),
+        'features': {key: str(features.get(key) or '').strip() for key in FEATURE_KEYS},
+    }
+
+
+def remember(concept):
+    """Cache the parts of a concept under its enhanced prompt, where
+    suggestions.suggest() and cached_features() look for them."""
+    enhanced_prompt = concept['enhanced_prompt']
+    for kind, value in (('objects', concept['objects']), ('colors', concept['color_combinations']),
+                        ('features', concept['features'])):
+        if value and (kind != 'features' or any(value.values())):
+            prompt_cache.set(kind, SUGGESTION_MODEL, enhanced_prompt, value)
+
+
+def cached_features(enhanced_prompt):
+    return prompt_cache.get('features', SUGGESTION_MODEL, enhanced_prompt)
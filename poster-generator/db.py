@@ -0,0 +1,93 @@
+import contextlib
+import os
+import sqlite3
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process dev server only
+    fcntl = None
+
+# --- Shared SQLite plumbing ---
+# Databases run in WAL mode so any number of worker processes and threads can
+# read while one writes; writers queue on the busy timeout instead of failing,
+# and every connection belongs to exactly one thread of one process. WAL is
+# switched on once, under the setup lock; the mode is stored in the file, so
+# later connections need no journal_mode pragma of their own.
+BUSY_TIMEOUT_SECONDS = 30
+SETUP_RETRY_SECONDS = 30
+
+
+def _is_busy(error):
+    return 'locked' in str(error) or 'busy' in str(error)
+
+
+class Database:
+    schema = ''
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        # A connection inherited across fork() (e.g. gunicorn --preload) must
+        # not be reused by the child.
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_SECONDS)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            if not self._initialized:
+                with self._init_lock, self._file_lock():
+                    if not self._initialized:
+                        self._retry_busy(lambda: conn.execute('PRAGMA journal_mode=WAL'))
+                        self._setup(conn)
+                        self._initialized = True
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _setup(self, conn):
+        conn.executescript(self.schema)
+
+    def _retry_busy(self, fn):
+        # Changing the journal mode needs the database to itself and does not
+        # always wait on busy_timeout, so SQLITE_BUSY is retried here.
+        deadline = time.monotonic() + SETUP_RETRY_SECONDS
+        delay = 0.01
+        while True:
+            try:
+                return fn()
+            except sqlite3.OperationalError as e:
+                if not _is_busy(e) or time.monotonic() > deadline:
+                    raise
+                time.sleep(delay)
+                delay = min(delay * 2, 0.5)
+
+    @contextlib.contextmanager
+    def _file_lock(self):
+        # Serializes schema creation and one-time migrations across processes.
+        if fcntl is None:
+            yield
+            return
+        with open(self.path + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @contextlib.contextmanager
+    def _write(self, conn):
+        # BEGIN IMMEDIATE takes the write lock up front, so concurrent writers
+        # wait on busy_timeout rather than failing on a lock upgrade.
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        else:
+            conn.commit()
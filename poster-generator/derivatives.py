@@ -0,0 +1,81 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+
+import image_store
+import metrics
+
+# --- Responsive derivatives ---
+# Every stored poster gets downscaled variants written next to it in the
+# image store (<hash>.thumb, <hash>.medium). They are produced on a small
+# background pool after generation, or on first request if that has not run
+# yet; producing them is idempotent, so backfills and races are harmless.
+VARIANTS = {
+    'thumb': 360,
+    'medium': 960,
+}
+DERIVATIVE_QUALITY = int(os.environ.get('DERIVATIVE_QUALITY', '80'))
+DERIVATIVE_WORKERS = int(os.environ.get('DERIVATIVE_WORKERS', '2'))
+
+_executor = ThreadPoolExecutor(max_workers=DERIVATIVE_WORKERS, thread_name_prefix='derivatives')
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def derivative_format():
+    from PIL import features
+    return 'WEBP' if features.check('webp') else 'JPEG'
+
+
+def derivative_path(image_hash, variant):
+    return f'{image_store.image_path(image_hash)}.{variant}'
+
+
+def has_derivatives(image_hash):
+    return all(os.path.exists(derivative_path(image_hash, v)) for v in VARIANTS)
+
+
+def ensure_derivatives(image_hash):
+    """Write any missing variants of an image; returns how many were written."""
+    missing = [v for v in VARIANTS if not os.path.exists(derivative_path(image_hash, v))]
+    if not missing:
+        return 0
+    from PIL import Image
+    fmt = derivative_format()
+    with Image.open(BytesIO(image_store.read_image(image_hash))) as source:
+        # JPEG can decode at a reduced scale, which is much cheaper than a
+        # full decode followed by a resize.
+        largest = max(VARIANTS[v] for v in missing)
+        source.draft('RGB', (largest, int(source.height * largest / source.width)))
+        img = source.convert('RGBA' if fmt == 'WEBP' else 'RGB')
+    for variant in sorted(missing, key=lambda v: -VARIANTS[v]):
+        width = min(VARIANTS[variant], img.width)
+        resized = img.resize((width, max(1, round(img.height * width / img.width))), Image.LANCZOS)
+        buffered = BytesIO()
+        resized.save(buffered, format=fmt, quality=DERIVATIVE_QUALITY)
+        image_store.write_atomic(derivative_path(image_hash, variant), buffered.getvalue())
+    return len(missing)
+
+
+def _run(image_hash):
+    try:
+        with metrics.timed('derivatives'):
+            ensure_derivatives(image_hash)
+    except Exception:
+        pass
+    finally:
+        with _pending_lock:
+            _pending.discard(image_hash)
+
+
+def schedule(image_hashes):
+    """Queue derivative generation for images that are not already queued."""
+    for image_hash in image_hashes:
+        with _pending_lock:
+            if image_hash in _pending or has_derivatives(image_hash):
+                continue
+            _pending.add(image_hash)
+        _executor.submit(_run, image_hash)
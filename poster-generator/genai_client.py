@@ -0,0 +1,283 @@
+import os
+import random
+import sqlite3
+import threading
+import time
+
+from db import Database
+
+# --- Shared GenAI client ---
+# One client per process reuses pooled HTTP connections and TLS sessions for
+# every Gemini and Imagen call. Calls go through call(), which adds a
+# per-model token-bucket rate limit, retries with exponential backoff and
+# jitter on transient failures, and a circuit breaker that fails fast while
+# the upstream is down.
+#
+# GENAI_BASE_URL points the client at another endpoint, e.g. a local stub.
+#
+# google-genai (with httpx and pydantic under it) is most of the app's import
+# time, so it is only imported when the first call is made.
+GENAI_BASE_URL = os.environ.get('GENAI_BASE_URL')
+GENAI_TIMEOUT_MS = int(os.environ.get('GENAI_TIMEOUT_MS', '120000'))
+GENAI_MAX_CONNECTIONS = int(os.environ.get('GENAI_MAX_CONNECTIONS', '20'))
+
+GENAI_MAX_RETRIES = int(os.environ.get('GENAI_MAX_RETRIES', '3'))
+GENAI_BACKOFF_BASE = float(os.environ.get('GENAI_BACKOFF_BASE', '0.5'))
+GENAI_BACKOFF_MAX = float(os.environ.get('GENAI_BACKOFF_MAX', '8'))
+RETRYABLE_STATUS = (408, 429, 500, 502, 503, 504)
+
+# Requests per minute per model, by model family. The limits hold across all
+# worker processes: the token buckets live in a SQLite table shared by every
+# process using GENAI_RATE_LIMIT_DB (the prompt cache database by default).
+# Set it to '' to keep a separate bucket in each process instead.
+GENAI_RATE_LIMIT_DB = os.environ.get('GENAI_RATE_LIMIT_DB', os.environ.get('POSTER_CACHE_DB', 'poster_cache.db'))
+RATE_LIMITS = {
+    'gemini': float(os.environ.get('GEMINI_RATE_PER_MINUTE', '300')),
+    'imagen': float(os.environ.get('IMAGEN_RATE_PER_MINUTE', '60')),
+}
+RATE_LIMIT_WAIT = float(os.environ.get('GENAI_RATE_LIMIT_WAIT', '30'))
+
+BREAKER_FAILURES = int(os.environ.get('GENAI_BREAKER_FAILURES', '5'))
+BREAKER_RESET_SECONDS = float(os.environ.get('GENAI_BREAKER_RESET_SECONDS', '30'))
+
+
+class UpstreamUnavailable(Exception):
+    """Raised without calling upstream: circuit open or rate limit exhausted."""
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute, burst=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = burst or max(1.0, rate_per_minute / 6.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            if now + wait > deadline:
+                raise UpstreamUnavailable('Rate limit exceeded')
+            time.sleep(wait)
+
+
+class RateLimitStore(Database):
+    schema = """
+    CREATE TABLE IF NOT EXISTS rate_limits (
+        key TEXT PRIMARY KEY,
+        tokens REAL NOT NULL,
+        updated REAL NOT NULL
+    );
+    """
+
+    def take(self, key, rate, capacity):
+        """Take one token from a bucket; returns 0, or the seconds until one is available."""
+        now = time.time()
+        conn = self._connect()
+        with self._write(conn):
+            row = conn.execute('SELECT tokens, updated FROM rate_limits WHERE key = ?', (key,)).fetchone()
+            tokens = capacity if row is None else min(capacity, row[0] + max(0.0, now - row[1]) * rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            conn.execute('INSERT OR REPLACE INTO rate_limits (key, tokens, updated) VALUES (?, ?, ?)',
+                         (key, tokens, now))
+        return wait
+
+
+class SharedTokenBucket(TokenBucket):
+    """A TokenBucket whose state is shared by all processes through a
+    RateLimitStore. Falls back to this process's own bucket if the database
+    cannot be used."""
+
+    def __init__(self, store, key, rate_per_minute, burst=None):
+        super().__init__(rate_per_minute, burst)
+        self.store = store
+        self.key = key
+
+    def acquire(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                wait = self.store.take(self.key, self.rate, self.capacity)
+            except sqlite3.Error:
+                return super().acquire(max(0.0, deadline - time.monotonic()))
+            if not wait:
+                return
+            if time.monotonic() + wait > deadline:
+                raise UpstreamUnavailable('Rate limit exceeded')
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """Opens after ``failures`` consecutive failures; after ``reset_seconds``
+    one trial call is let through and its outcome closes or re-opens it."""
+
+    def __init__(self, failures=BREAKER_FAILURES, reset_seconds=BREAKER_RESET_SECONDS):
+        self.failure_threshold = failures
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return 'half-open'
+        return 'open'
+
+    def before_call(self):
+        with self._lock:
+            state = self.state
+            if state == 'open' or (state == 'half-open' and self.trial_running):
+                raise UpstreamUnavailable('Upstream temporarily unavailable')
+            if state == 'half-open':
+                self.trial_running = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+_limiters = {}
+_rate_limit_store = RateLimitStore(GENAI_RATE_LIMIT_DB) if GENAI_RATE_LIMIT_DB else None
+_breakers = {}
+_state_lock = threading.Lock()
+
+
+def get_client():
+    global _client, _client_pid
+    # Re-created after fork so worker processes never share a connection pool.
+    if _client is None or _client_pid != os.getpid():
+        with _client_lock:
+            if _client is None or _client_pid != os.getpid():
+                import httpx
+                from google import genai
+                from google.genai import types
+                http_options = types.HttpOptions(
+                    timeout=GENAI_TIMEOUT_MS,
+                    client_args={'limits': httpx.Limits(
+                        max_connections=GENAI_MAX_CONNECTIONS,
+                        max_keepalive_connections=GENAI_MAX_CONNECTIONS,
+                    )},
+                )
+                if GENAI_BASE_URL:
+                    http_options.base_url = GENAI_BASE_URL
+                _client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY"), http_options=http_options)
+                _client_pid = os.getpid()
+    return _client
+
+
+def model_family(model):
+    return 'imagen' if 'imagen' in model else 'gemini'
+
+
+def _limiter(model):
+    with _state_lock:
+        if model not in _limiters:
+            rate = RATE_LIMITS[model_family(model)]
+            _limiters[model] = SharedTokenBucket(_rate_limit_store, model, rate) if _rate_limit_store \
+                else TokenBucket(rate)
+        return _limiters[model]
+
+
+def breaker(model):
+    with _state_lock:
+        if model not in _breakers:
+            _breakers[model] = CircuitBreaker()
+        return _breakers[model]
+
+
+def is_retryable(error):
+    import httpx
+    from google.genai import errors
+    if isinstance(error, errors.APIError):
+        return error.code in RETRYABLE_STATUS
+    return isinstance(error, (httpx.TransportError, ConnectionError, TimeoutError))
+
+
+def backoff_delay(attempt):
+    # "Full jitter": a random delay up to the exponential cap.
+    return random.uniform(0, min(GENAI_BACKOFF_MAX, GENAI_BACKOFF_BASE * (2 ** attempt)))
+
+
+def call(model, fn):
+    """Run ``fn(client)`` for ``model`` with rate limiting, retries and the breaker."""
+    circuit = breaker(model)
+    attempt = 0
+    while True:
+        # The token is taken first: in the half-open state before_call()
+        # claims the single trial call, which must be followed by a call.
+        _limiter(model).acquire(RATE_LIMIT_WAIT)
+        circuit.before_call()
+        try:
+            result = fn(get_client())
+        except Exception as e:
+            if not is_retryable(e):
+                # The upstream answered; a bad request says nothing about its health.
+                circuit.record_success()
+                raise
+            circuit.record_failure()
+            if attempt >= GENAI_MAX_RETRIES:
+                raise
+            time.sleep(backoff_delay(attempt))
+            attempt += 1
+            continue
+        circuit.record_success()
+        return result
+
+
+def generate_text(model, contents, config):
+    """Stream a generate_content response and return the full text."""
+    def run(client):
+        response_text = ""
+        for chunk in client.models.generate_content_stream(model=model, contents=contents, config=config):
+            if hasattr(chunk, 'text') and chunk.text:
+                response_text += chunk.text
+        return response_text
+    return call(model, run)
+
+
+def complete(model, prompt, schema=None):
+    """Send one plain-text user prompt and return the response text.
+
+    With ``schema`` (an OpenAPI-style dict) the model is asked for JSON
+    matching it; the caller parses the returned text.
+    """
+    from google.genai import types
+    contents = [types.Content(role="user", parts=[types.Part(text=prompt)])]
+    config = types.GenerateContentConfig(
+        thinking_config=types.ThinkingConfig(),
+        response_mime_type="application/json" if schema else "text/plain",
+        response_schema=schema,
+    )
+    return generate_text(model, contents, config)
+
+
+def generate_images(model, prompt, config):
+    return call(model, lambda client: client.models.generate_images(model=model, prompt=prompt, config=config))
@@ -0,0 +1,141 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+import image_store
+from cache import CACHE_DB
+from db import Database
+
+# --- Imagen request deduplication ---
+# Identical generation requests (same prompt, aspect ratio, image count and
+# slot) that are in flight at the same time share one upstream call. With
+# IMAGEN_REUSE_SECONDS > 0 the images are also kept in the image store and an
+# exact repeat within that window is served from disk without calling Imagen.
+IMAGEN_REUSE_SECONDS = float(os.environ.get('IMAGEN_REUSE_SECONDS', '0'))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS generation_cache (
+    key TEXT PRIMARY KEY,
+    hashes TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS generation_cache_created ON generation_cache(created);
+"""
+
+
+class SingleFlight:
+    """Collapses concurrent calls with the same key into one execution."""
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """Return (result, shared); shared is True for callers that waited
+        on another caller's execution instead of running ``fn`` themselves."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = fn()
+            return call.result, False
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class ResultStore(Database):
+    schema = SCHEMA
+
+    def get(self, key, max_age):
+        row = self._connect().execute(
+            'SELECT hashes FROM generation_cache WHERE key = ? AND created >= ?',
+            (key, time.time() - max_age),
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, hashes, max_age):
+        now = time.time()
+        conn = self._connect()
+        with self._write(conn):
+            conn.execute(
+                'INSERT OR REPLACE INTO generation_cache (key, hashes, created) VALUES (?, ?, ?)',
+                (key, json.dumps(hashes), now),
+            )
+            conn.execute('DELETE FROM generation_cache WHERE created < ?', (now - max_age,))
+
+
+class DedupingBackend:
+    """Wraps an image backend with in-flight coalescing and result reuse.
+
+    ``slot`` tells apart requests that are meant to produce different images
+    for the same prompt, e.g. the parallel single-image requests of one
+    fan-out generation.
+    """
+
+    def __init__(self, backend, reuse_seconds=IMAGEN_REUSE_SECONDS, store_path=CACHE_DB):
+        self.backend = backend
+        self.reuse_seconds = reuse_seconds
+        self.store = ResultStore(store_path)
+        self._flight = SingleFlight()
+        self._lock = threading.Lock()
+        self._counters = defaultdict(int)
+
+    def _count(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def generate(self, prompt, aspect_ratio, number_of_images=3, slot=0):
+        key = hashlib.sha256(json.dumps([prompt, aspect_ratio, number_of_images, slot]).encode('utf-8')).hexdigest()
+        if self.reuse_seconds > 0:
+            images = self._reuse(key)
+            if images is not None:
+                self._count('reused')
+                return images
+        images, shared = self._flight.do(key, lambda: self._fresh(key, prompt, aspect_ratio, number_of_images))
+        if shared:
+            self._count('coalesced')
+        return images
+
+    def _reuse(self, key):
+        try:
+            hashes = self.store.get(key, self.reuse_seconds)
+            if hashes is None:
+                return None
+            return [image_store.read_image(h) for h in hashes]
+        except Exception:
+            return None
+
+    def _fresh(self, key, prompt, aspect_ratio, number_of_images):
+        self._count('fresh')
+        images = self.backend.generate(prompt, aspect_ratio, number_of_images=number_of_images)
+        if self.reuse_seconds > 0 and images:
+            try:
+                self.store.set(key, [image_store.put_image(data) for data in images], self.reuse_seconds)
+            except Exception:
+                pass
+        return images
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters)
@@ -0,0 +1,255 @@
+import json
+import os
+import re
+
+import image_store
+from db import Database
+from prompt_features import features_text
+
+# --- SQLite-backed generation history ---
+# Each generation is one appended row; a timestamp index lets /history read a
+# single page without loading or sorting the rest of the table. A contentless
+# FTS5 index over the prompt and its extracted features is written in the
+# same transaction as each row, so search never lags behind the history.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    prompt TEXT NOT NULL,
+    aspect_ratio TEXT,
+    entry TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS history_timestamp ON history(timestamp);
+DROP INDEX IF EXISTS history_aspect_ratio;
+CREATE INDEX IF NOT EXISTS history_ratio_timestamp ON history(aspect_ratio, timestamp);
+"""
+# The aspect ratio is indexed as one token (9:16 -> r9x16), so keyword
+# searches filter on it inside FTS5 instead of row by row after the match.
+SEARCH_TABLE = """
+CREATE VIRTUAL TABLE IF NOT EXISTS history_search USING fts5(
+    prompt, features, aspect_ratio, content='', tokenize='unicode61 remove_diacritics 2'
+)
+"""
+# Bumped when the indexed text changes, to rebuild existing indexes
+SEARCH_INDEX_VERSION = 3
+
+# Keyword searches in a date window narrower than this many rows look up the
+# window's exact id range first
+SEARCH_WINDOW_SCAN_ROWS = 20000
+
+
+def ratio_token(aspect_ratio):
+    return 'r' + re.sub(r'\W', 'x', aspect_ratio) if aspect_ratio else ''
+
+
+class HistoryStore(Database):
+    schema = SCHEMA + SEARCH_TABLE + ';'
+
+    def __init__(self, path, legacy_json=None):
+        super().__init__(path)
+        self.legacy_json = legacy_json
+
+    def _setup(self, conn):
+        super()._setup(conn)
+        self._rebuild_stale_index(conn)
+        self._import_legacy(conn)
+        self._index_missing(conn)
+
+    def _rebuild_stale_index(self, conn):
+        # The search index is rebuilt from the history whenever what goes
+        # into it changes; PRAGMA user_version records the layout it has.
+        if conn.execute('PRAGMA user_version').fetchone()[0] >= SEARCH_INDEX_VERSION:
+            return
+        with self._write(conn):
+            conn.execute('DROP TABLE history_search')
+            conn.execute(SEARCH_TABLE)
+            conn.execute(f'PRAGMA user_version = {SEARCH_INDEX_VERSION}')
+
+    def _index(self, conn, row_id, entry):
+        prompt = entry.get('prompt', '')
+        conn.execute(
+            'INSERT INTO history_search (rowid, prompt, features, aspect_ratio) VALUES (?, ?, ?, ?)',
+            (row_id, prompt, features_text(entry.get('enhanced_prompt') or prompt),
+             ratio_token(entry.get('aspect_ratio'))),
+        )
+
+    def _index_missing(self, conn):
+        # Rows written before the search index existed are indexed once.
+        last = conn.execute('SELECT MAX(rowid) FROM history_search').fetchone()[0] or 0
+        with self._write(conn):
+            for row_id, entry in conn.execute('SELECT id, entry FROM history WHERE id > ? ORDER BY id', (last,)).fetchall():
+                self._index(conn, row_id, json.loads(entry))
+
+    def _import_legacy(self, conn):
+        # One-time import of the old generation_history.json, moving any base64
+        # posters into the image store on the way.
+        if not self.legacy_json or not os.path.exists(self.legacy_json):
+            return
+        if conn.execute('SELECT 1 FROM history LIMIT 1').fetchone():
+            return
+        self.import_json(self.legacy_json, conn)
+        os.replace(self.legacy_json, self.legacy_json + '.imported')
+
+    def import_json(self, json_path, conn=None):
+        """Import a generation_history.json file; returns how many entries
+        were added. Entries already in the history (same timestamp and
+        prompt) are skipped, so importing a file twice adds nothing."""
+        # Read before connecting: the first connection may run the legacy
+        # import, which renames that file.
+        with open(json_path, 'r', encoding='utf-8') as f:
+            try:
+                entries = json.load(f)
+            except Exception:
+                entries = []
+        conn = conn or self._connect()
+        entries.sort(key=lambda e: e.get('timestamp', ''))
+        imported = 0
+        with self._write(conn):
+            for entry in entries:
+                if conn.execute('SELECT 1 FROM history WHERE timestamp = ? AND prompt = ?',
+                                (entry.get('timestamp', ''), entry.get('prompt', ''))).fetchone():
+                    continue
+                image_store.migrate_entry_images(entry)
+                self._insert(conn, entry)
+                imported += 1
+        return imported
+
+    def _insert(self, conn, entry):
+        cur = conn.execute(
+            'INSERT INTO history (timestamp, prompt, aspect_ratio, entry) VALUES (?, ?, ?, ?)',
+            (entry.get('timestamp', ''), entry.get('prompt', ''), entry.get('aspect_ratio'),
+             json.dumps(entry, ensure_ascii=False)),
+        )
+        self._index(conn, cur.lastrowid, entry)
+        return cur.lastrowid
+
+    def append(self, entry):
+        conn = self._connect()
+        with self._write(conn):
+            return self._insert(conn, entry)
+
+    def page(self, before=None, before_id=None, limit=20):
+        """Return (entries, next_cursor), newest first.
+
+        ``before`` is the timestamp cursor from the previous page and
+        ``before_id`` optionally breaks ties between rows written in the same
+        instant. next_cursor is a (timestamp, id) pair, or None when there are
+        no older entries.
+        """
+        conn = self._connect()
+        if before and before_id is not None:
+            rows = conn.execute(
+                'SELECT id, timestamp, entry FROM history WHERE (timestamp, id) < (?, ?) '
+                'ORDER BY timestamp DESC, id DESC LIMIT ?',
+                (before, before_id, limit + 1),
+            ).fetchall()
+        elif before:
+            rows = conn.execute(
+                'SELECT id, timestamp, entry FROM history WHERE timestamp < ? '
+                'ORDER BY timestamp DESC, id DESC LIMIT ?',
+                (before, limit + 1),
+            ).fetchall()
+        else:
+            rows = conn.execute(
+                'SELECT id, timestamp, entry FROM history ORDER BY timestamp DESC, id DESC LIMIT ?',
+                (limit + 1,),
+            ).fetchall()
+        next_cursor = (rows[limit - 1][1], rows[limit - 1][0]) if len(rows) > limit else None
+        return [json.loads(row[2]) for row in rows[:limit]], next_cursor
+
+    def search(self, query='', aspect_ratio=None, since=None, until=None, before_id=None, limit=20):
+        """Return (entries, next_before_id) matching all filters, newest first.
+
+        ``query`` words must all occur in the prompt or its extracted features
+        (each word also matches as a prefix). ``since``/``until`` bound the ISO
+        timestamp, ``until`` exclusively. Pass the returned next_before_id
+        back as before_id for the next page.
+        """
+        terms = re.findall(r'\w+', query or '')
+        conn = self._connect()
+        conditions, values = [], []
+        if aspect_ratio:
+            conditions.append('h.aspect_ratio = ?')
+            values.append(aspect_ratio)
+        if since:
+            conditions.append('h.timestamp >= ?')
+            values.append(since)
+        if until:
+            conditions.append('h.timestamp < ?')
+            values.append(until)
+        if terms:
+            # FTS5 drives the query and yields rowids newest first, so the
+            # join stops after limit + 1 matches. The aspect ratio is part of
+            # the match, and a date window is turned into a rowid range, so
+            # neither makes it walk matches that are rejected afterwards.
+            source = 'history_search JOIN history h ON h.id = history_search.rowid'
+            order = 'history_search.rowid DESC'
+            match = '{prompt features} : (' + ' '.join(f'"{term}"*' for term in terms) + ')'
+            if aspect_ratio:
+                match += f' AND aspect_ratio : {ratio_token(aspect_ratio)}'
+            conditions.append('history_search MATCH ?')
+            values.append(match)
+            if since or until:
+                low, high = self._id_range(conn, since, until, aspect_ratio)
+                if low is None:
+                    return [], None
+                conditions.append('history_search.rowid BETWEEN ? AND ?')
+                values.extend((low, high))
+            if before_id is not None:
+                conditions.append('history_search.rowid < ?')
+                values.append(before_id)
+        elif since or until or aspect_ratio:
+            # Walk the (aspect ratio,) timestamp index newest first, so the
+            # query stops after limit + 1 rows of the window.
+            index = 'history_ratio_timestamp' if aspect_ratio else 'history_timestamp'
+            source = f'history h INDEXED BY {index}'
+            order = 'h.timestamp DESC, h.id DESC'
+            if before_id is not None:
+                row = conn.execute('SELECT timestamp FROM history WHERE id = ?', (before_id,)).fetchone()
+                if row is None:
+                    return [], None
+                conditions.append('(h.timestamp, h.id) < (?, ?)')
+                values.extend((row[0], before_id))
+        else:
+            source = 'history h'
+            order = 'h.id DESC'
+            if before_id is not None:
+                conditions.append('h.id < ?')
+                values.append(before_id)
+        where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+        rows = conn.execute(
+            f'SELECT h.id, h.entry FROM {source} {where} ORDER BY {order} LIMIT ?',
+            values + [limit + 1],
+        ).fetchall()
+        next_before_id = rows[limit - 1][0] if len(rows) > limit else None
+        return [json.loads(row[1]) for row in rows[:limit]], next_before_id
+
+    def _id_range(self, conn, since, until, aspect_ratio=None):
+        """Lowest and highest id written inside a timestamp window."""
+        conditions, values = [], []
+        if aspect_ratio:
+            conditions.append('aspect_ratio = ?')
+            values.append(aspect_ratio)
+        if since:
+            conditions.append('timestamp >= ?')
+            values.append(since)
+        if until:
+            conditions.append('timestamp < ?')
+            values.append(until)
+        where = ' AND '.join(conditions)
+        # Rows are appended roughly in timestamp order, so the ids at the
+        # window's edges tell its size and whether it reaches the newest rows.
+        # A wide window that does needs no range: the newest-first walk is
+        # already where the matches are. Otherwise the exact range is read
+        # from the timestamp index, at a cost proportional to the window.
+        first = conn.execute(f'SELECT id FROM history WHERE {where} ORDER BY timestamp LIMIT 1', values).fetchone()
+        if first is None:
+            return None, None
+        last = conn.execute(f'SELECT id FROM history WHERE {where} ORDER BY timestamp DESC LIMIT 1', values).fetchone()
+        newest = conn.execute('SELECT MAX(id) FROM history').fetchone()[0]
+        if abs(last[0] - first[0]) > SEARCH_WINDOW_SCAN_ROWS and newest - last[0] <= SEARCH_WINDOW_SCAN_ROWS:
+            return 0, newest
+        return conn.execute(f'SELECT MIN(id), MAX(id) FROM history WHERE {where}', values).fetchone()
+
+    def count(self):
+        return self._connect().execute('SELECT COUNT(*) FROM history').fetchone()[0]
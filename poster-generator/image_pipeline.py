@@ -0,0 +1,96 @@
+import os
+import threading
+import time
+from functools import lru_cache
+from io import BytesIO
+
+import metrics
+
+# --- Poster output pipeline ---
+# Images from the backend are kept as the bytes it sent (Imagen's JPEG) and
+# only decoded when something has to be drawn on them. When a poster is
+# re-encoded, the format is negotiated from the client's Accept header.
+#
+# Encodes run on the calling thread: a generation job's worker, or the request
+# thread for /overlay-logo, which waits for its encode. ENCODE_WORKERS only
+# caps how many encodes run at once across the process; further callers wait
+# for a slot. Pillow itself is imported on first use, not at startup.
+ENCODE_QUALITY = int(os.environ.get('POSTER_ENCODE_QUALITY', '85'))
+ENCODE_WORKERS = int(os.environ.get('ENCODE_WORKERS', str(os.cpu_count() or 2)))
+# Server preference when the client accepts several formats equally well.
+# AVIF is the smallest but by far the slowest to encode.
+OUTPUT_FORMATS = [f.strip() for f in os.environ.get('POSTER_OUTPUT_FORMATS', 'webp,avif,jpeg').split(',') if f.strip()]
+
+# format name -> (mimetype, Pillow format, Pillow feature that must be available)
+FORMATS = {
+    'jpeg': ('image/jpeg', 'JPEG', None),
+    'webp': ('image/webp', 'WEBP', 'webp'),
+    'avif': ('image/avif', 'AVIF', 'avif'),
+    'png': ('image/png', 'PNG', None),
+}
+MIMETYPE_FORMATS = {mimetype: name for name, (mimetype, _, _) in FORMATS.items()}
+
+_encode_slots = threading.BoundedSemaphore(ENCODE_WORKERS)
+
+
+def _supported(name):
+    from PIL import features
+    feature = FORMATS[name][2]
+    try:
+        return feature is None or bool(features.check(feature))
+    except Exception:
+        return False
+
+
+@lru_cache(maxsize=None)
+def supported_formats():
+    return [name for name in OUTPUT_FORMATS if name in FORMATS and _supported(name)] or ['jpeg']
+
+
+class SourceImage:
+    """Encoded image bytes as received, with dimensions read from the header."""
+
+    def __init__(self, data):
+        from PIL import Image
+        self.data = data
+        with Image.open(BytesIO(data)) as img:
+            self.width, self.height = img.size
+            self.format = (img.format or 'jpeg').lower()
+
+    def decode(self):
+        from PIL import Image
+        with metrics.timed('decode'):
+            img = Image.open(BytesIO(self.data))
+            img.load()
+            return img
+
+
+def negotiate_format(accept_mimetypes):
+    """Pick an output format from a werkzeug Accept header.
+
+    Only formats the client names explicitly count (``*/*`` would otherwise
+    match AVIF for clients that cannot show it); JPEG is the fallback.
+    """
+    best, best_quality = 'jpeg', 0
+    for name in supported_formats():
+        quality = max((q for value, q in accept_mimetypes if value == FORMATS[name][0]), default=0)
+        if quality > best_quality:
+            best, best_quality = name, quality
+    return best
+
+
+def encode(img, fmt, quality=ENCODE_QUALITY):
+    """Encode once a slot is free; returns (bytes, encode_ms)."""
+    with metrics.timed('encode'), _encode_slots:
+        return _encode(img, fmt, quality)
+
+
+def _encode(img, fmt, quality):
+    started = time.perf_counter()
+    pil_format = FORMATS[fmt][1]
+    if pil_format == 'JPEG' and img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    buffered = BytesIO()
+    options = {} if pil_format == 'PNG' else {'quality': quality}
+    img.save(buffered, format=pil_format, **options)
+    return buffered.getvalue(), (time.perf_counter() - started) * 1000
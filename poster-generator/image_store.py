@@ -0,0 +1,104 @@
+import base64
+import hashlib
+import os
+import re
+import tempfile
+
+import metrics
+
+# --- Content-addressed image store ---
+# Images are written once under IMAGE_DIR/<first two hex chars>/<sha256>, so
+# identical bytes are stored a single time and a hash uniquely names an image.
+IMAGE_DIR = os.environ.get('POSTER_IMAGE_DIR', 'poster_images')
+
+HASH_RE = re.compile(r'^[0-9a-f]{64}$')
+
+_SIGNATURES = [
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+]
+
+
+def is_valid_hash(image_hash):
+    return bool(image_hash) and bool(HASH_RE.match(image_hash))
+
+
+def sniff_mimetype(head):
+    for signature, mimetype in _SIGNATURES:
+        if head.startswith(signature):
+            return mimetype
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    if head[4:8] == b'ftyp' and head[8:12] in (b'avif', b'avis'):
+        return 'image/avif'
+    return 'application/octet-stream'
+
+
+def image_path(image_hash):
+    return os.path.join(IMAGE_DIR, image_hash[:2], image_hash)
+
+
+def has_image(image_hash):
+    return is_valid_hash(image_hash) and os.path.exists(image_path(image_hash))
+
+
+def write_atomic(path, data):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    # Write to a temp file in the same directory and rename it into place so a
+    # reader never sees a partially written image.
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def put_image(data):
+    """Store image bytes and return their sha256 hex digest."""
+    with metrics.timed('store'):
+        image_hash = hashlib.sha256(data).hexdigest()
+        path = image_path(image_hash)
+        if not os.path.exists(path):
+            write_atomic(path, data)
+        return image_hash
+
+
+def read_image(image_hash):
+    with open(image_path(image_hash), 'rb') as f:
+        return f.read()
+
+
+def file_mimetype(path):
+    with open(path, 'rb') as f:
+        return sniff_mimetype(f.read(16))
+
+
+def image_mimetype(image_hash):
+    return file_mimetype(image_path(image_hash))
+
+
+def migrate_entry_images(entry):
+    """Move base64 poster blobs of a history entry into the store.
+
+    Returns True if the entry was modified.
+    """
+    changed = False
+    for poster in entry.get('posters', []):
+        data = poster.get('image')
+        if not data:
+            continue
+        try:
+            raw = base64.b64decode(data)
+        except Exception:
+            continue
+        poster['hash'] = put_image(raw)
+        del poster['image']
+        changed = True
+    return changed
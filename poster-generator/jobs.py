@@ -0,0 +1,188 @@
+import json
+import math
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from db import Database
+
+# --- Background generation jobs ---
+# A submitted job is recorded in the database and run on a bounded worker
+# pool, so the request that submitted it returns immediately. Job state lives
+# in SQLite rather than in memory, so any worker process can answer status
+# and event requests for a job another process is running.
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+ERROR = 'error'
+FINISHED = (DONE, ERROR)
+
+# Finished jobs are kept this long for late pollers.
+JOB_RETENTION_SECONDS = 24 * 60 * 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    params TEXT NOT NULL,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_updated ON jobs(updated);
+"""
+
+
+class QueueFull(Exception):
+    def __init__(self, retry_after):
+        super().__init__('Generation queue is full')
+        self.retry_after = retry_after
+
+
+class JobStore(Database):
+    schema = SCHEMA
+
+    def create(self, job_id, params):
+        now = time.time()
+        conn = self._connect()
+        with self._write(conn):
+            conn.execute(
+                'INSERT INTO jobs (id, status, created, updated, params) VALUES (?, ?, ?, ?, ?)',
+                (job_id, QUEUED, now, now, json.dumps(params)),
+            )
+            conn.execute(
+                'DELETE FROM jobs WHERE updated < ? AND status IN (?, ?)',
+                (now - JOB_RETENTION_SECONDS, DONE, ERROR),
+            )
+
+    def update(self, job_id, status=None, result=None, error=None):
+        fields, values = ['updated = ?'], [time.time()]
+        if status is not None:
+            fields.append('status = ?')
+            values.append(status)
+        if result is not None:
+            fields.append('result = ?')
+            values.append(json.dumps(result))
+        if error is not None:
+            fields.append('error = ?')
+            values.append(error)
+        conn = self._connect()
+        with self._write(conn):
+            conn.execute(f'UPDATE jobs SET {", ".join(fields)} WHERE id = ?', values + [job_id])
+
+    def get(self, job_id):
+        row = self._connect().execute(
+            'SELECT id, status, created, updated, result, error FROM jobs WHERE id = ?', (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            'id': row[0],
+            'status': row[1],
+            'created': row[2],
+            'updated': row[3],
+            'result': json.loads(row[4]) if row[4] else None,
+            'error': row[5],
+        }
+
+
+class JobManager:
+    """Runs ``runner(params, progress)`` for submitted jobs on a bounded pool.
+
+    At most ``max_workers`` jobs run at once and at most ``max_queue`` more
+    wait; beyond that submit() raises QueueFull with a Retry-After estimate.
+    ``progress(result)`` lets the runner publish partial results while it runs.
+    """
+
+    def __init__(self, runner, store, max_workers=4, max_queue=16):
+        self.runner = runner
+        self.store = store
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='jobs')
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._avg_duration = 10.0
+        self._finished = {}
+        # Wakes event streams in this process as soon as a job changes; streams
+        # for jobs running in other processes fall back to polling.
+        self._changed = threading.Condition()
+
+    def submit(self, params):
+        if not self._slots.acquire(blocking=False):
+            raise QueueFull(self.retry_after())
+        job_id = uuid.uuid4().hex
+        try:
+            self.store.create(job_id, params)
+            with self._lock:
+                self._pending += 1
+                self._finished[job_id] = threading.Event()
+            self._executor.submit(metrics.bind(self._run), job_id, params)
+        except Exception:
+            self._slots.release()
+            raise
+        return job_id
+
+    def pending(self):
+        """Jobs queued or running in this process."""
+        with self._lock:
+            return self._pending
+
+    def retry_after(self):
+        # Roughly how long until a slot frees up, given recent job durations.
+        with self._lock:
+            waves = max(1, self._pending - self.max_workers + 1) / self.max_workers
+            return max(1, math.ceil(self._avg_duration * waves))
+
+    def _run(self, job_id, params):
+        started = time.monotonic()
+        try:
+            self._update(job_id, status=RUNNING)
+            result = self.runner(params, lambda partial: self._update(job_id, result=partial))
+            self._update(job_id, status=DONE, result=result)
+        except Exception as e:
+            self._update(job_id, status=ERROR, error=str(e))
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self._avg_duration = 0.8 * self._avg_duration + 0.2 * (time.monotonic() - started)
+                finished = self._finished.pop(job_id, None)
+            self._slots.release()
+            if finished:
+                finished.set()
+
+    def _update(self, job_id, **changes):
+        self.store.update(job_id, **changes)
+        with self._changed:
+            self._changed.notify_all()
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    def wait(self, job_id, timeout=None):
+        """Block until a job submitted by this process finishes; return it."""
+        with self._lock:
+            finished = self._finished.get(job_id)
+        if finished:
+            finished.wait(timeout)
+        return self.store.get(job_id)
+
+    def events(self, job_id, poll_interval=0.5, timeout=600):
+        """Yield the job each time it changes, until it finishes or times out."""
+        deadline = time.monotonic() + timeout
+        last_updated = None
+        while time.monotonic() < deadline:
+            job = self.store.get(job_id)
+            if job is None:
+                return
+            if job['updated'] != last_updated:
+                last_updated = job['updated']
+                yield job
+            if job['status'] in FINISHED:
+                return
+            with self._changed:
+                self._changed.wait(poll_interval)
@@ -0,0 +1,227 @@
+import contextvars
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from contextlib import nullcontext
+
+# --- Stage timing and metrics ---
+# timed('stage') wraps one piece of work (an Imagen call, a decode, an
+# encode, ...). Each measurement feeds a latency histogram, an in-flight gauge
+# and an error counter exposed in Prometheus text format, and is also added
+# to the Server-Timing header of the request that caused it. Work handed to
+# thread pools keeps its request through bind(). With POSTER_METRICS=0,
+# timed() returns a shared no-op context manager and nothing is recorded.
+METRICS_ENABLED = os.environ.get('POSTER_METRICS', '1') == '1'
+# Sampling profiler, only active for requests that ask for it (?profile=1)
+PROFILING_ENABLED = os.environ.get('POSTER_PROFILING', '0') == '1'
+PROFILE_INTERVAL = float(os.environ.get('POSTER_PROFILE_INTERVAL', '0.005'))
+PROFILE_DIR = os.environ.get('POSTER_PROFILE_DIR', 'profiles')
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_NOOP = nullcontext()
+_request_timings = contextvars.ContextVar('request_timings', default=None)
+
+
+class Histogram:
+    def __init__(self, name, help_text, label, buckets=BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value, seconds):
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            # Buckets are stored non-cumulative and summed when exposed
+            series[0][bisect_left(self.buckets, seconds)] += 1
+            series[1] += seconds
+            series[2] += 1
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for value, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, n in zip(self.buckets, counts):
+                    cumulative += n
+                    lines.append(f'{self.name}_bucket{{{self.label}="{value}",le="{bound}"}} {cumulative}')
+                lines.append(f'{self.name}_bucket{{{self.label}="{value}",le="+Inf"}} {count}')
+                lines.append(f'{self.name}_sum{{{self.label}="{value}"}} {total:.6f}')
+                lines.append(f'{self.name}_count{{{self.label}="{value}"}} {count}')
+        return lines
+
+
+class LabeledValue:
+    """A gauge or counter with a single label."""
+
+    def __init__(self, name, help_text, label, kind):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.kind = kind
+        self._values = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def add(self, label_value, amount=1):
+        with self._lock:
+            self._values[label_value] += amount
+
+    def set(self, label_value, value):
+        with self._lock:
+            self._values[label_value] = value
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            for value, n in sorted(self._values.items()):
+                lines.append(f'{self.name}{{{self.label}="{value}"}} {n}')
+        return lines
+
+
+stage_seconds = Histogram('poster_stage_seconds', 'Time spent in each processing stage.', 'stage')
+stage_in_flight = LabeledValue('poster_stage_in_flight', 'Stages currently running.', 'stage', 'gauge')
+stage_errors = LabeledValue('poster_stage_errors_total', 'Stages that raised an exception.', 'stage', 'counter')
+request_seconds = Histogram('poster_http_request_seconds', 'Request latency by endpoint.', 'endpoint')
+requests_in_flight = LabeledValue('poster_http_requests_in_flight', 'Requests currently being handled.', 'endpoint', 'gauge')
+request_errors = LabeledValue('poster_http_request_errors_total', 'Responses with a 5xx status.', 'endpoint', 'counter')
+startup_seconds = LabeledValue('poster_startup_seconds', 'Startup time by phase (import, warm_up, first_response).', 'phase', 'gauge')
+
+REGISTRY = [stage_seconds, stage_in_flight, stage_errors, request_seconds, requests_in_flight, request_errors,
+            startup_seconds]
+
+
+class _Timer:
+    __slots__ = ('stage', 'started')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        stage_in_flight.add(self.stage)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        ended = time.perf_counter()
+        elapsed = ended - self.started
+        stage_in_flight.add(self.stage, -1)
+        if exc_type is not None:
+            stage_errors.add(self.stage)
+        stage_seconds.observe(self.stage, elapsed)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((self.stage, self.started, ended))
+        return False
+
+
+def timed(stage):
+    return _Timer(stage) if METRICS_ENABLED else _NOOP
+
+
+def bind(fn):
+    """Run ``fn`` in a copy of the caller's context, for thread pools, so the
+    stages it times are attributed to the caller's request."""
+    if not METRICS_ENABLED:
+        return fn
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+
+def start_request():
+    """Begin collecting stage timings for the current request; returns a token for end_request."""
+    return _request_timings.set([])
+
+
+def request_timings():
+    return _request_timings.get() or []
+
+
+def end_request(token):
+    _request_timings.reset(token)
+
+
+def server_timing(timings, total=None):
+    """Format (stage, started, ended) records as a Server-Timing header value.
+
+    A stage that ran more than once is reported as the wall-clock time during
+    which at least one run was active, so parallel fan-out (three Imagen calls
+    at once) is not summed past the request total; desc gives the run count.
+    """
+    spans = {}
+    for stage, started, ended in timings:
+        spans.setdefault(stage, []).append((started, ended))
+    entries = []
+    for stage, intervals in spans.items():
+        intervals.sort()
+        seconds = 0.0
+        current_start, current_end = intervals[0]
+        for started, ended in intervals[1:]:
+            if started > current_end:
+                seconds += current_end - current_start
+                current_start = started
+            current_end = max(current_end, ended)
+        seconds += current_end - current_start
+        entry = f'{stage};dur={seconds * 1000:.1f}'
+        if len(intervals) > 1:
+            entry += f';desc="x{len(intervals)}"'
+        entries.append(entry)
+    if total is not None:
+        entries.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(entries)
+
+
+def expose():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.expose())
+    return '\n'.join(lines) + '\n'
+
+
+class Sampler:
+    """Sampling profiler: records the stacks of all other threads every
+    ``interval`` seconds and writes them in collapsed (flame graph) format."""
+
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            names.update((t.ident, t.name) for t in threading.enumerate())
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def stop(self, name):
+        """Stop sampling and write the profile; returns its path."""
+        self._stop.set()
+        self._thread.join()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f'{time.strftime("%Y%m%d-%H%M%S")}-{name}-{os.getpid()}.folded')
+        with open(path, 'w') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f'{stack} {count}\n')
+        return path
@@ -0,0 +1,29 @@
+import re
+
+# --- Key feature extraction ---
+# Pulls "Visual Style: ...", "Tone: ..." style fields out of an enhanced
+# prompt. Used by /extract-features and to index the history for search.
+FEATURE_KEYS = ('title', 'visual_style', 'color_scheme', 'typography', 'graphic_elements',
+                'background', 'audience', 'purpose', 'tone')
+
+_FEATURE_PATTERNS = {
+    key: re.compile(rf'{key.replace("_", " ").title()}:\s*(.*?)(?:\.|$)', re.IGNORECASE)
+    for key in FEATURE_KEYS
+}
+
+
+def extract_key_features(enhanced_prompt):
+    # Simple regex-based extraction for demo purposes
+    features = dict.fromkeys(FEATURE_KEYS, '')
+    # Try to extract each feature from the enhanced prompt
+    for key, pattern in _FEATURE_PATTERNS.items():
+        match = pattern.search(enhanced_prompt)
+        if match:
+            features[key] = match.group(1).strip()
+    return features
+
+
+def features_text(prompt):
+    """The extracted feature values as one searchable string. The labels are
+    left out, or a search for "tone" would match every entry that has one."""
+    return ' '.join(value for value in extract_key_features(prompt).values() if value)
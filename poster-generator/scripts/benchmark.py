@@ -0,0 +1,341 @@
+"""Offline benchmark for the poster app's routes.
+
+Runs the app against the local GenAI stub (scripts/genai_stub_server.py), so
+no API quota is used, with injectable upstream latency and error rate. Each
+route is driven at a fixed concurrency for every requested history size, and
+latency percentiles, throughput, response sizes and peak RSS are written as
+JSON. Each history size runs in a fresh process, so peak RSS is per size.
+
+    python scripts/benchmark.py --concurrency 8 --requests 200 --output bench.json
+    python scripts/benchmark.py --history-sizes 100,100000 --baseline bench.json --output new.json
+
+With --baseline, routes whose p95 latency or throughput got worse by more
+than --tolerance are reported and the script exits with status 1. It also
+exits with status 1 if every request to a route failed.
+
+/step4 only queues a job, so its latency is measured until the job's event
+stream reports it finished, and a failed job counts as an error.
+
+Posters come from the app's fake Imagen backend by default. --imagen stub
+sends them through the stub instead, which needs a google-genai release that
+still supports generate_images on the Developer API.
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(SCRIPTS_DIR)
+
+ENHANCED_PROMPT = (
+    "Create a high-resolution poster for the event. Visual Style: clean and modern. "
+    "Color Scheme: electric blue and crisp white. Typography: bold sans-serif. Tone: energetic."
+)
+
+SEED_CHUNK = 1000
+
+ROUTES = ['enhance', 'step4', 'generate-poster', 'regen-suggestions', 'extract-features', 'history']
+
+
+def build_request(route, i, repeat_prompts):
+    """Return (method, path, body, content_type) for the i-th request to a route."""
+    suffix = '' if repeat_prompts else f' #{i}'
+    if route == 'enhance':
+        return 'POST', '/enhance', urlencode({'prompt': f'Tech fest poster{suffix}', 'aspect_ratio': '9:16'}), \
+            'application/x-www-form-urlencoded'
+    if route == 'step4':
+        return 'POST', '/step4', urlencode({'prompt': f'Tech fest poster{suffix}', 'enhanced_prompt': ENHANCED_PROMPT,
+                                            'aspect_ratio': '9:16'}), 'application/x-www-form-urlencoded'
+    if route == 'generate-poster':
+        return 'POST', '/generate-poster', json.dumps({'prompt': f'{ENHANCED_PROMPT}{suffix}', 'aspect_ratio': '9:16'}), \
+            'application/json'
+    if route == 'regen-suggestions':
+        return 'POST', '/regen-suggestions', json.dumps({'enhanced_prompt': f'{ENHANCED_PROMPT}{suffix}'}), \
+            'application/json'
+    if route == 'extract-features':
+        return 'POST', '/extract-features', json.dumps({'enhanced_prompt': f'{ENHANCED_PROMPT}{suffix}'}), \
+            'application/json'
+    if route == 'history':
+        return 'GET', '/history', None, None
+    raise ValueError(f'unknown route {route}')
+
+
+def send(port, method, path, body, content_type, follow_job=False):
+    """Return (status, seconds, size). With ``follow_job`` the time runs until
+    the job queued by the response has finished; a failed job is a 500."""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=600)
+    started = time.perf_counter()
+    try:
+        headers = {'Content-Type': content_type} if content_type else {}
+        conn.request(method, path, body=body, headers=headers)
+        response = conn.getresponse()
+        data = response.read()
+        status = response.status
+        if follow_job and status == 200:
+            match = re.search(rb'/jobs/[0-9a-f]+/events', data)
+            if match:
+                # The event stream ends once the job has finished
+                conn.request('GET', match.group().decode())
+                events = re.findall(rb'^event: (\w+)', conn.getresponse().read(), re.MULTILINE)
+                if not events or events[-1] != b'done':
+                    status = 500
+            elif b'/images/' not in data:
+                # Finished before the page was rendered, without any posters
+                status = 500
+        return status, time.perf_counter() - started, len(data)
+    except Exception:
+        return 0, time.perf_counter() - started, 0
+    finally:
+        conn.close()
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def drive(port, route, requests, concurrency, repeat_prompts):
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        started = time.perf_counter()
+        samples = list(pool.map(
+            lambda i: send(port, *build_request(route, i, repeat_prompts), follow_job=route == 'step4'),
+            range(requests)))
+        wall = time.perf_counter() - started
+    latencies = sorted(seconds * 1000 for _, seconds, _ in samples)
+    statuses = Counter(str(status) for status, _, _ in samples)
+    return {
+        'requests': requests,
+        'concurrency': concurrency,
+        'statuses': dict(statuses),
+        'errors': sum(n for status, n in statuses.items() if not status.startswith(('2', '3'))),
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'mean_ms': round(sum(latencies) / len(latencies), 2),
+        'max_ms': round(latencies[-1], 2),
+        'requests_per_second': round(requests / wall, 2),
+        'bytes_per_response': round(sum(size for _, _, size in samples) / requests),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def seed_history(history_store, image_store, size, workdir):
+    """Fill the history with ``size`` entries sharing a few stored posters."""
+    from io import BytesIO
+    from PIL import Image
+    hashes = []
+    for color in [(20, 60, 140), (140, 60, 20), (60, 140, 20)]:
+        buffered = BytesIO()
+        Image.new('RGB', (768, 1408), color).save(buffered, format='JPEG', quality=85)
+        hashes.append(image_store.put_image(buffered.getvalue()))
+    start = datetime.now() - timedelta(seconds=size)
+    path = os.path.join(workdir, 'seed.json')
+    elapsed = 0.0
+    # Imported in chunks so seeding does not inflate the peak RSS being measured
+    for offset in range(0, size, SEED_CHUNK):
+        entries = [{
+            'prompt': f'Seeded poster prompt number {n} for a college tech fest',
+            'aspect_ratio': '9:16',
+            'posters': [{'id': f'poster_{i}', 'hash': h, 'width': 768, 'height': 1408, 'format': 'jpeg'}
+                        for i, h in enumerate(hashes)],
+            'timestamp': (start + timedelta(seconds=n)).isoformat(),
+        } for n in range(offset, min(size, offset + SEED_CHUNK))]
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(entries, f)
+        started = time.perf_counter()
+        history_store.import_json(path)
+        elapsed += time.perf_counter() - started
+    return elapsed
+
+
+def run_size(history_size, options, results):
+    """Benchmark every route against a fresh app with ``history_size`` entries (child process)."""
+    workdir = tempfile.mkdtemp(prefix='poster-bench-')
+    os.environ.update({
+        'GEMINI_API_KEY': 'stub',
+        'POSTER_IMAGE_DIR': os.path.join(workdir, 'images'),
+        'POSTER_HISTORY_DB': os.path.join(workdir, 'history.db'),
+        'POSTER_CACHE_DB': os.path.join(workdir, 'cache.db'),
+        'POSTER_PROFILE_DIR': os.path.join(workdir, 'profiles'),
+    })
+    sys.path[:0] = [APP_DIR, SCRIPTS_DIR]
+    from genai_stub_server import start_server
+    stub, state = start_server(latency=options['latency'], error_rate=options['error_rate'],
+                               image_scale=options['image_scale'])
+    os.environ['GENAI_BASE_URL'] = f'http://127.0.0.1:{stub.server_port}'
+    if not options['rate_limits']:
+        # Measure the app, not the per-model quota it enforces on itself
+        os.environ.update({'GEMINI_RATE_PER_MINUTE': '1000000', 'IMAGEN_RATE_PER_MINUTE': '1000000'})
+    if options['imagen'] == 'fake':
+        os.environ.update({
+            'POSTER_IMAGE_BACKEND': 'fake',
+            'FAKE_IMAGEN_LATENCY': str(options['latency']),
+            'FAKE_IMAGEN_ERROR_RATE': str(options['error_rate']),
+        })
+
+    started = time.perf_counter()
+    import app as poster_app
+    import image_store
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+    import_seconds = time.perf_counter() - started
+
+    seed_seconds = seed_history(poster_app.history_store, image_store, history_size, workdir)
+    server = make_server('127.0.0.1', 0, poster_app.app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    routes = {}
+    for route in options['routes']:
+        routes[route] = drive(server.server_port, route, options['requests'], options['concurrency'],
+                              options['repeat_prompts'])
+        # Let queued generation jobs finish so they do not load the next route
+        deadline = time.monotonic() + 600
+        while poster_app.job_manager.pending() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        print(f"  {history_size:>7} entries  {route:<18} p50 {routes[route]['p50_ms']:>9.1f} ms  "
+              f"p95 {routes[route]['p95_ms']:>9.1f} ms  {routes[route]['requests_per_second']:>8.1f} req/s  "
+              f"errors {routes[route]['errors']}", flush=True)
+    server.shutdown()
+    results.put({
+        'history_size': history_size,
+        'import_seconds': round(import_seconds, 3),
+        'seed_seconds': round(seed_seconds, 3),
+        'routes': routes,
+        'upstream': {'requests': state.requests, 'injected_errors': state.errors},
+        'peak_rss_mb': peak_rss_mb(),
+    })
+
+
+def compare(baseline, runs, tolerance):
+    """Return regressions of p95 latency or throughput against a baseline run."""
+    previous = {(run['history_size'], route): stats
+                for run in baseline.get('runs', []) for route, stats in run['routes'].items()}
+    regressions = []
+    for run in runs:
+        for route, stats in run['routes'].items():
+            before = previous.get((run['history_size'], route))
+            if not before:
+                continue
+            if before['p95_ms'] and stats['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+                regressions.append(f"{route} @ {run['history_size']}: p95 {before['p95_ms']} -> {stats['p95_ms']} ms")
+            if before['requests_per_second'] and \
+                    stats['requests_per_second'] < before['requests_per_second'] * (1 - tolerance):
+                regressions.append(f"{route} @ {run['history_size']}: "
+                                   f"{before['requests_per_second']} -> {stats['requests_per_second']} req/s")
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=APP_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--routes', default=','.join(ROUTES), help='comma-separated subset of: ' + ', '.join(ROUTES))
+    parser.add_argument('--history-sizes', default='100,1000,10000,100000')
+    parser.add_argument('--requests', type=int, default=100, help='requests per route')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds added to every upstream call')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of upstream calls that fail')
+    parser.add_argument('--image-scale', type=float, default=1.0, help='scale of the stub posters')
+    parser.add_argument('--imagen', choices=['stub', 'fake'], default='fake')
+    parser.add_argument('--rate-limits', action='store_true', help='keep the client-side GenAI rate limits')
+    parser.add_argument('--repeat-prompts', action='store_true', help='send the same prompt every time (cache hits)')
+    parser.add_argument('--output', default='benchmark.json')
+    parser.add_argument('--baseline', help='earlier results to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative slowdown before failing')
+    args = parser.parse_args()
+
+    options = {
+        'routes': [r.strip() for r in args.routes.split(',') if r.strip()],
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'latency': args.latency,
+        'error_rate': args.error_rate,
+        'image_scale': args.image_scale,
+        'imagen': args.imagen,
+        'repeat_prompts': args.repeat_prompts,
+        'rate_limits': args.rate_limits,
+    }
+    unknown = [r for r in options['routes'] if r not in ROUTES]
+    if unknown:
+        parser.error(f'unknown routes: {", ".join(unknown)}')
+
+    context = multiprocessing.get_context('spawn')
+    runs = []
+    for size in [int(s) for s in args.history_sizes.split(',') if s.strip()]:
+        results = context.Queue()
+        proc = context.Process(target=run_size, args=(size, options, results))
+        proc.start()
+        while True:
+            try:
+                run = results.get(timeout=1)
+                break
+            except queue.Empty:
+                if not proc.is_alive():
+                    sys.exit(f'Benchmark with {size} history entries failed (exit code {proc.exitcode})')
+        proc.join()
+        runs.append(run)
+
+    report = {
+        'created': datetime.now().isoformat(),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'config': options,
+        'runs': runs,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f'Wrote {args.output}')
+
+    failed_routes = [f"{route} @ {run['history_size']}" for run in runs
+                     for route, stats in run['routes'].items() if stats['errors'] == stats['requests']]
+    if failed_routes:
+        for route in failed_routes:
+            print(f'FAIL: every request to {route} failed')
+        sys.exit(1)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(json.load(f), runs, args.tolerance)
+        if regressions:
+            for regression in regressions:
+                print(f'REGRESSION: {regression}')
+            sys.exit(1)
+        print(f'No regressions against {args.baseline}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""Local stand-in for the Gemini/Imagen REST API.
+
+Serves streamGenerateContent, generateContent and predict (Imagen) with
+canned responses, injectable latency and a configurable rate of retryable
+errors, so the GenAI client layer can be exercised without real quota:
+
+    python scripts/genai_stub_server.py --port 8089 --latency 0.2 --error-rate 0.1
+    GENAI_BASE_URL=http://127.0.0.1:8089 GEMINI_API_KEY=stub flask run
+"""
+import argparse
+import base64
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+from PIL import Image
+
+ENHANCED_PROMPT = (
+    "Create a high-resolution poster for the event. The visual style should be clean and modern, "
+    "utilizing a bold color palette of electric blue and crisp white. The main title should be rendered "
+    "in a large, bold sans-serif font, prominently placed at the top."
+)
+OBJECTS = ["glowing circuit lines", "stylized rocket", "geometric stars", "abstract waves", "laurel wreath"]
+COLORS = ["electric blue and crisp white", "deep ocean blue and bright coral", "emerald green and brushed gold"]
+
+SIZES = {'1:1': (1024, 1024), '3:4': (896, 1280), '4:3': (1280, 896), '9:16': (768, 1408), '16:9': (1408, 768)}
+
+
+class StubState:
+    def __init__(self, latency=0.0, error_rate=0.0, error_status=503, image_scale=1.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.image_scale = image_scale
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._jpeg_cache = {}
+
+    def jpeg(self, aspect_ratio):
+        # Rendered once per size: the stub should not be the bottleneck.
+        if aspect_ratio not in self._jpeg_cache:
+            w, h = SIZES.get(aspect_ratio, SIZES['1:1'])
+            size = (max(1, int(w * self.image_scale)), max(1, int(h * self.image_scale)))
+            buffered = BytesIO()
+            Image.new('RGB', size, (20, 60, 140)).save(buffered, format='JPEG', quality=85)
+            self._jpeg_cache[aspect_ratio] = buffered.getvalue()
+        return self._jpeg_cache[aspect_ratio]
+
+
+FEATURES = {
+    'title': 'Annual Tech Fest 2025', 'visual_style': 'clean and modern', 'color_scheme': 'electric blue and crisp white',
+    'typography': 'large, bold sans-serif', 'graphic_elements': 'abstract geometric patterns',
+    'background': 'subtle tech-themed patterns', 'audience': 'college students', 'purpose': 'event announcement',
+    'tone': 'energetic',
+}
+
+
+def response_text(request_body):
+    if 'responseSchema' in request_body.get('generationConfig', {}):
+        return json.dumps({'enhanced_prompt': ENHANCED_PROMPT, 'objects': OBJECTS, 'color_combinations': COLORS,
+                           'features': FEATURES})
+    text = json.dumps(request_body)
+    if 'visual objects' in text:
+        return json.dumps(OBJECTS)
+    if 'color combinations' in text:
+        return json.dumps(COLORS)
+    return ENHANCED_PROMPT
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            request_body = json.loads(self.rfile.read(length) or b'{}')
+            with state._lock:
+                state.requests += 1
+            if state.latency:
+                time.sleep(state.latency)
+            if state.error_rate and random.random() < state.error_rate:
+                with state._lock:
+                    state.errors += 1
+                self._send_json(state.error_status, {'error': {
+                    'code': state.error_status, 'message': 'Injected stub error', 'status': 'UNAVAILABLE'}})
+                return
+
+            path = self.path.split('?')[0]
+            if path.endswith(':predict'):
+                params = request_body.get('parameters', {})
+                data = base64.b64encode(state.jpeg(params.get('aspectRatio', '1:1'))).decode()
+                count = int(params.get('sampleCount', 1))
+                self._send_json(200, {'predictions': [
+                    {'bytesBase64Encoded': data, 'mimeType': 'image/jpeg'} for _ in range(count)]})
+            elif path.endswith(':streamGenerateContent'):
+                text = response_text(request_body)
+                # Stream the text in a few SSE chunks like the real API.
+                step = max(1, len(text) // 3)
+                body = b''.join(
+                    b'data: ' + json.dumps({'candidates': [{'content': {
+                        'role': 'model', 'parts': [{'text': text[i:i + step]}]}}]}).encode() + b'\r\n\r\n'
+                    for i in range(0, len(text), step)
+                )
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            elif path.endswith(':generateContent'):
+                self._send_json(200, {'candidates': [{'content': {
+                    'role': 'model', 'parts': [{'text': response_text(request_body)}]}}]})
+            else:
+                self._send_json(404, {'error': {'code': 404, 'message': 'Unknown method', 'status': 'NOT_FOUND'}})
+
+    return Handler
+
+
+def start_server(port=0, **options):
+    """Start the stub on a background thread; returns (server, state)."""
+    state = StubState(**options)
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests that fail')
+    parser.add_argument('--error-status', type=int, default=503)
+    args = parser.parse_args()
+    state = StubState(args.latency, args.error_rate, args.error_status)
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), make_handler(state))
+    print(f'GenAI stub listening on http://127.0.0.1:{args.port}')
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Cold-start timing for the poster app.
+
+Starts fresh interpreters and measures how long importing the app takes, how
+long from the start of the import until the first response, and what
+warm_up() costs, with and without running it before the first request:
+
+    python scripts/startup_time.py --runs 5
+    python scripts/startup_time.py --max-import-ms 400 --output startup.json
+
+With --max-import-ms or --max-first-response-ms the script exits with status
+1 when the median is over the limit.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the child interpreter; prints one JSON line.
+CHILD = """
+import json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {app_dir!r})
+import app
+imported = time.perf_counter()
+warm_up_ms = None
+if {warm_up!r}:
+    app.warm_up()
+    warm_up_ms = (time.perf_counter() - imported) * 1000
+response = app.app.test_client().get('/history')
+assert response.status_code == 200, response.status_code
+print(json.dumps({{
+    'import_ms': (imported - started) * 1000,
+    'warm_up_ms': warm_up_ms,
+    'first_response_ms': (time.perf_counter() - started) * 1000,
+    'modules': len(sys.modules),
+}}))
+"""
+
+
+def run_once(warm_up, workdir):
+    env = dict(os.environ,
+               POSTER_IMAGE_DIR=os.path.join(workdir, 'images'),
+               POSTER_HISTORY_DB=os.path.join(workdir, 'history.db'),
+               POSTER_CACHE_DB=os.path.join(workdir, 'cache.db'),
+               POSTER_METRICS='1')
+    output = subprocess.run([sys.executable, '-c', CHILD.format(app_dir=APP_DIR, warm_up=warm_up)],
+                            env=env, cwd=workdir, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def summarize(samples, key):
+    values = [s[key] for s in samples if s[key] is not None]
+    if not values:
+        return None
+    return {'median': round(statistics.median(values), 1), 'min': round(min(values), 1), 'max': round(max(values), 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--output', help='write the results as JSON')
+    parser.add_argument('--max-import-ms', type=float)
+    parser.add_argument('--max-first-response-ms', type=float)
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        run_once(False, workdir)  # creates the databases, and warms the OS file cache
+        for mode, warm_up in (('lazy', False), ('warm_up', True)):
+            samples = [run_once(warm_up, workdir) for _ in range(args.runs)]
+            results[mode] = {key: summarize(samples, key)
+                             for key in ('import_ms', 'warm_up_ms', 'first_response_ms', 'modules')}
+            print(f"{mode:<8} import {results[mode]['import_ms']['median']:>7.1f} ms   "
+                  f"first response {results[mode]['first_response_ms']['median']:>7.1f} ms   "
+                  f"modules {results[mode]['modules']['median']:.0f}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'runs': args.runs, 'python': sys.version.split()[0], 'results': results}, f, indent=2)
+
+    failures = []
+    if args.max_import_ms and results['lazy']['import_ms']['median'] > args.max_import_ms:
+        failures.append(f"import {results['lazy']['import_ms']['median']} ms > {args.max_import_ms} ms")
+    if args.max_first_response_ms and results['lazy']['first_response_ms']['median'] > args.max_first_response_ms:
+        failures.append(f"first response {results['lazy']['first_response_ms']['median']} ms > "
+                        f"{args.max_first_response_ms} ms")
+    for failure in failures:
+        print(f'FAIL: {failure}')
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""Concurrency stress test for the history database and image store.
+
+Runs many simulated generations from several processes and threads against
+one database, the way N gunicorn workers would, then checks that every entry
+landed exactly once, the database is intact and every poster hash resolves to
+the bytes that produced it.
+
+    python scripts/stress_history.py --processes 8 --threads 4 --generations 50
+    python scripts/stress_history.py --processes 8 --threads 8 --generations 5 --runs 30
+"""
+import argparse
+import hashlib
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import image_store  # noqa: E402
+from history_store import HistoryStore  # noqa: E402
+
+
+def simulate_generation(store, worker, thread, n):
+    # Three small unique "posters" plus one identical to every other
+    # generation, so concurrent writes of the same hash are exercised too.
+    tag = f'{worker}-{thread}-{n}'
+    posters = []
+    for i, payload in enumerate([f'{tag}-{i}'.encode() for i in range(3)] + [b'shared-poster']):
+        posters.append({'id': f'poster_{i}', 'hash': image_store.put_image(payload), 'width': 1, 'height': 1})
+    store.append({
+        'prompt': f'stress {tag}',
+        'aspect_ratio': '9:16',
+        'posters': posters,
+        'timestamp': datetime.now().isoformat(),
+    })
+    # Interleave reads with the writes, as /history requests would.
+    store.page(limit=5)
+
+
+def run_worker(worker, db_path, image_dir, threads, generations):
+    image_store.IMAGE_DIR = image_dir
+    store = HistoryStore(db_path)
+
+    def run_thread(thread):
+        for n in range(generations):
+            simulate_generation(store, worker, thread, n)
+
+    pool = [threading.Thread(target=run_thread, args=(t,)) for t in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+
+
+def verify(db_path, image_dir, processes, threads, generations):
+    image_store.IMAGE_DIR = image_dir
+    errors = []
+    conn = sqlite3.connect(db_path)
+    integrity = conn.execute('PRAGMA integrity_check').fetchone()[0]
+    if integrity != 'ok':
+        errors.append(f'integrity_check: {integrity}')
+
+    store = HistoryStore(db_path)
+    expected = processes * threads * generations
+    seen = {}
+    cursor = (None, None)
+    while True:
+        entries, cursor = store.page(before=cursor[0], before_id=cursor[1], limit=100)
+        for entry in entries:
+            seen[entry['prompt']] = seen.get(entry['prompt'], 0) + 1
+            for poster in entry['posters']:
+                data = image_store.read_image(poster['hash'])
+                if hashlib.sha256(data).hexdigest() != poster['hash']:
+                    errors.append(f'corrupt image {poster["hash"]}')
+        if cursor is None:
+            break
+
+    count = store.count()
+    if count != expected:
+        errors.append(f'expected {expected} rows, found {count}')
+    if len(seen) != expected:
+        errors.append(f'{expected - len(seen)} entries lost')
+    duplicates = [prompt for prompt, n in seen.items() if n > 1]
+    if duplicates:
+        errors.append(f'{len(duplicates)} duplicated entries')
+    leftovers = [name for _, _, files in os.walk(image_dir) for name in files if name.startswith('.tmp-')]
+    if leftovers:
+        errors.append(f'{len(leftovers)} temp files left in image store')
+    return expected, errors
+
+
+def run_once(processes, threads, generations):
+    """One stress run against a fresh database; returns (expected, elapsed, errors)."""
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, 'history.db')
+        image_dir = os.path.join(workdir, 'images')
+        procs = [
+            multiprocessing.Process(target=run_worker, args=(w, db_path, image_dir, threads, generations))
+            for w in range(processes)
+        ]
+        started = datetime.now()
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+        elapsed = (datetime.now() - started).total_seconds()
+
+        failed = [p.exitcode for p in procs if p.exitcode != 0]
+        expected, errors = verify(db_path, image_dir, processes, threads, generations)
+        if failed:
+            errors.append(f'{len(failed)} worker processes crashed')
+    return expected, elapsed, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--generations', type=int, default=25)
+    parser.add_argument('--runs', type=int, default=1,
+                        help='repeat on fresh databases; races on first use show up only some of the time')
+    args = parser.parse_args()
+
+    failures = 0
+    for run in range(1, args.runs + 1):
+        expected, elapsed, errors = run_once(args.processes, args.threads, args.generations)
+        print(f'run {run}: {expected} generations from {args.processes} processes x {args.threads} threads '
+              f'in {elapsed:.2f}s')
+        for error in errors:
+            print(f'FAIL: {error}')
+        failures += bool(errors)
+    if failures:
+        print(f'{failures} of {args.runs} runs failed')
+        sys.exit(1)
+    print('OK: no lost, duplicated or corrupted entries')
+
+
+if __name__ == '__main__':
+    main()
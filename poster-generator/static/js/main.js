@@ -68,9 +68,13 @@ class PosterGenerator {
             this.showEnhancedPrompt(enhancedPrompt);
             this.showLoading("Generating poster...");
 
-            const posters = await this.generatePosters(enhancedPrompt, aspectRatio, logoFile);
-
-            this.showPosters(posters);
+            // Posters are added to the grid one by one as each finishes
+            this.posterGrid.innerHTML = '';
+            let shown = 0;
+            await this.generatePosters(enhancedPrompt, aspectRatio, logoFile, (src) => {
+                this.addPoster(src, shown++);
+                this.resultsSection.style.display = 'block';
+            });
         } catch (error) {
             console.error("Error generating poster:", error);
             alert("Something went wrong while generating your poster.");
@@ -99,11 +103,12 @@ class PosterGenerator {
         }
     }
 
-    async generatePosters(prompt, aspectRatio, logoFile) {
+    async generatePosters(prompt, aspectRatio, logoFile, onPoster) {
         // Use FormData to send logo file if present
         const formData = new FormData();
         formData.append('prompt', prompt);
         formData.append('aspect_ratio', aspectRatio);
+        formData.append('async', '1');
         if (logoFile) {
             formData.append('logo', logoFile);
         }
@@ -111,16 +116,63 @@ class PosterGenerator {
             method: 'POST',
             body: formData
         });
+        if (response.status === 429) {
+            const retryAfter = response.headers.get('Retry-After') || 'a few';
+            throw new Error(`Server is busy, please retry in ${retryAfter} seconds`);
+        }
         if (!response.ok) {
             throw new Error('Failed to generate posters');
         }
-        const data = await response.json();
-        if (data.posters) {
-            // Return array of base64 images
-            return data.posters.map(p => `data:image/png;base64,${p.image}`);
-        } else {
-            throw new Error(data.error || 'No posters returned');
-        }
+        const job = await this.waitForJob(await response.json(), onPoster);
+        // Return array of image URLs served from the image store
+        return job.posters.map(p => p.url);
+    }
+
+    // Follow a generation job over Server-Sent Events until it finishes,
+    // handing each poster URL to onPoster as soon as it is ready
+    waitForJob(job, onPoster) {
+        const seen = new Set();
+        const deliver = (data) => {
+            data.posters.forEach(p => {
+                if (!seen.has(p.id)) {
+                    seen.add(p.id);
+                    if (onPoster) onPoster(p.url);
+                }
+            });
+        };
+        return new Promise((resolve, reject) => {
+            const source = new EventSource(job.events_url);
+            source.addEventListener('queued', () => {
+                this.loadingText.textContent = 'Waiting for a free generator...';
+            });
+            source.addEventListener('running', (e) => {
+                const data = JSON.parse(e.data);
+                deliver(data);
+                this.loadingText.textContent = data.posters.length
+                    ? `Generating poster... (${data.posters.length} ready)`
+                    : 'Generating poster...';
+            });
+            source.addEventListener('done', (e) => {
+                source.close();
+                const data = JSON.parse(e.data);
+                deliver(data);
+                if (data.errors && data.errors.length) {
+                    console.warn('Some posters failed to generate:', data.errors);
+                }
+                resolve(data);
+            });
+            source.addEventListener('failed', (e) => {
+                source.close();
+                const data = JSON.parse(e.data);
+                reject(new Error(data.error || 'Failed to generate posters'));
+            });
+            // A dropped connection reconnects by itself; only give up if the browser has
+            source.addEventListener('error', () => {
+                if (source.readyState === EventSource.CLOSED) {
+                    reject(new Error('Lost connection to the poster generator'));
+                }
+            });
+        });
     }
 
     showLoading(text) {
@@ -141,97 +193,98 @@ class PosterGenerator {
 
     showPosters(images) {
         this.posterGrid.innerHTML = '';
+        images.forEach((src, idx) => this.addPoster(src, idx));
+        this.resultsSection.style.display = 'block';
+    }
+
+    addPoster(src, idx) {
         const logoFile = document.getElementById('logoUpload').files[0];
+
+        const card = document.createElement('div');
+        card.classList.add('poster-card');
+        card.style.position = 'relative';
+        card.innerHTML = `
+            <div class="overlay-container" style="position:relative;display:inline-block;">
+                <img src="${src}" alt="Poster Image" class="poster-image" style="display:block;max-width:100%;height:auto;" />
+            </div>
+            <div class="poster-controls">
+                <button class="btn btn-primary download-btn" type="button" style="margin-top: 10px;">
+                    <i class="fas fa-download"></i> Download with Logo
+                </button>
+                <div class="download-status" style="margin-top: 8px; font-size: 0.9rem; color: #666;"></div>
+            </div>
+        `;
         
-        images.forEach((src, idx) => {
-            const card = document.createElement('div');
-            card.classList.add('poster-card');
-            card.style.position = 'relative';
-            card.innerHTML = `
-                <div class="overlay-container" style="position:relative;display:inline-block;">
-                    <img src="${src}" alt="Poster Image" class="poster-image" style="display:block;max-width:100%;height:auto;" />
-                </div>
-                <div class="poster-controls">
-                    <button class="btn btn-primary download-btn" type="button" style="margin-top: 10px;">
-                        <i class="fas fa-download"></i> Download with Logo
-                    </button>
-                    <div class="download-status" style="margin-top: 8px; font-size: 0.9rem; color: #666;"></div>
-                </div>
-            `;
-            
-            const overlayContainer = card.querySelector('.overlay-container');
-            const posterImg = overlayContainer.querySelector('.poster-image');
-            const downloadBtn = card.querySelector('.download-btn');
-            const downloadStatus = card.querySelector('.download-status');
-            
-            let overlay = null;
-            let logoImgLoaded = false;
-            let posterImgLoaded = false;
-
-            // Helper to enable download only when all images are loaded
-            function checkReady() {
-                if ((logoFile ? logoImgLoaded : true) && posterImgLoaded) {
-                    downloadBtn.disabled = false;
-                    downloadStatus.textContent = logoFile ? 'Logo positioned - Ready to download' : 'Ready to download';
-                    downloadStatus.style.color = '#4ade80';
-                }
+        const overlayContainer = card.querySelector('.overlay-container');
+        const posterImg = overlayContainer.querySelector('.poster-image');
+        const downloadBtn = card.querySelector('.download-btn');
+        const downloadStatus = card.querySelector('.download-status');
+        
+        let overlay = null;
+        let logoImgLoaded = false;
+        let posterImgLoaded = false;
+
+        // Helper to enable download only when all images are loaded
+        function checkReady() {
+            if ((logoFile ? logoImgLoaded : true) && posterImgLoaded) {
+                downloadBtn.disabled = false;
+                downloadStatus.textContent = logoFile ? 'Logo positioned - Ready to download' : 'Ready to download';
+                downloadStatus.style.color = '#4ade80';
             }
+        }
+
+        // Poster image load handling
+        posterImg.onload = () => {
+            posterImgLoaded = true;
+            checkReady();
+        };
+        
+        if (posterImg.complete) {
+            posterImgLoaded = true;
+            checkReady();
+        }
 
-            // Poster image load handling
-            posterImg.onload = () => {
-                posterImgLoaded = true;
+        // Add logo overlay if logo file exists
+        if (logoFile) {
+            overlay = document.createElement('img');
+            overlay.src = URL.createObjectURL(logoFile);
+            overlay.className = 'logo-overlay';
+            overlay.style.position = 'absolute';
+            // Place at top-right with margin
+            overlay.style.right = '20px';
+            overlay.style.top = '20px';
+            overlay.style.left = '';
+            overlay.style.bottom = '';
+            overlay.style.width = '20%';
+            overlay.style.cursor = 'grab';
+            overlay.style.zIndex = 10;
+            overlay.style.border = '2px dashed rgba(255,255,255,0.5)';
+            overlay.style.borderRadius = '4px';
+            overlay.draggable = false;
+            overlay.crossOrigin = 'anonymous';
+            
+            overlay.onload = () => {
+                logoImgLoaded = true;
                 checkReady();
             };
             
-            if (posterImg.complete) {
-                posterImgLoaded = true;
+            if (overlay.complete) {
+                logoImgLoaded = true;
                 checkReady();
             }
+            
+            overlayContainer.appendChild(overlay);
+            
+            // Make overlay draggable and resizable
+            this.makeOverlayDraggable(overlay, overlayContainer, downloadStatus);
+        }
 
-            // Add logo overlay if logo file exists
-            if (logoFile) {
-                overlay = document.createElement('img');
-                overlay.src = URL.createObjectURL(logoFile);
-                overlay.className = 'logo-overlay';
-                overlay.style.position = 'absolute';
-                // Place at top-right with margin
-                overlay.style.right = '20px';
-                overlay.style.top = '20px';
-                overlay.style.left = '';
-                overlay.style.bottom = '';
-                overlay.style.width = '20%';
-                overlay.style.cursor = 'grab';
-                overlay.style.zIndex = 10;
-                overlay.style.border = '2px dashed rgba(255,255,255,0.5)';
-                overlay.style.borderRadius = '4px';
-                overlay.draggable = false;
-                overlay.crossOrigin = 'anonymous';
-                
-                overlay.onload = () => {
-                    logoImgLoaded = true;
-                    checkReady();
-                };
-                
-                if (overlay.complete) {
-                    logoImgLoaded = true;
-                    checkReady();
-                }
-                
-                overlayContainer.appendChild(overlay);
-                
-                // Make overlay draggable and resizable
-                this.makeOverlayDraggable(overlay, overlayContainer, downloadStatus);
-            }
-
-            // Download button click handler
-            downloadBtn.onclick = () => {
-                this.downloadPosterWithLogo(overlayContainer, downloadBtn, downloadStatus, idx);
-            };
+        // Download button click handler
+        downloadBtn.onclick = () => {
+            this.downloadPosterWithLogo(overlayContainer, downloadBtn, downloadStatus, idx);
+        };
 
-            this.posterGrid.appendChild(card);
-        });
-        
-        this.resultsSection.style.display = 'block';
+        this.posterGrid.appendChild(card);
     }
 
     // Enhanced draggable functionality with better feedback
@@ -0,0 +1,72 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import genai_client
+import metrics
+from cache import prompt_cache
+
+# --- Object and color suggestions ---
+# The objects and colors requests are independent, so they run side by side
+# on a bounded pool: a page waits for the slower of the two, never their sum,
+# and a request that overruns its timeout degrades to an empty list.
+SUGGESTION_MODEL = "gemini-2.0-flash-001"
+SUGGESTION_TIMEOUT = float(os.environ.get('SUGGESTION_TIMEOUT', '20'))
+SUGGESTION_WORKERS = int(os.environ.get('SUGGESTION_WORKERS', '8'))
+
+OBJECTS_PROMPT = """
+Given the following enhanced poster prompt, suggest a list of 5-8 distinct visual objects, motifs, or elements that would be visually compelling and relevant for the poster. Return only a JSON array of short object names or phrases, nothing else.\n\nPrompt:\n{enhanced_prompt}
+"""
+
+COLORS_PROMPT = """
+Given the following enhanced poster prompt, suggest 3-5 harmonious color combinations (each as a short descriptive phrase, e.g., 'emerald green and brushed gold', 'deep ocean blue and bright coral'). Return only a JSON array of color combination strings, nothing else.\n\nPrompt:\n{enhanced_prompt}
+"""
+
+_executor = ThreadPoolExecutor(max_workers=SUGGESTION_WORKERS, thread_name_prefix='suggestions')
+
+
+def _generate_text(prompt):
+    return genai_client.complete(SUGGESTION_MODEL, prompt)
+
+
+def _parse_list(text):
+    try:
+        value = json.loads(text)
+    except Exception:
+        return []
+    if not isinstance(value, list):
+        value = [str(value)]
+    return value
+
+
+def _suggest_list(kind, template, enhanced_prompt, fresh):
+    def compute():
+        with metrics.timed(f'gemini_{kind}'):
+            return _parse_list(_generate_text(template.format(enhanced_prompt=enhanced_prompt)))
+    return prompt_cache.get_or_compute(kind, SUGGESTION_MODEL, enhanced_prompt, compute, fresh=fresh)
+
+
+def suggest(enhanced_prompt, timeout=SUGGESTION_TIMEOUT, fresh=False):
+    """Return (objects, color_combinations) for an enhanced prompt.
+
+    Either list is empty if its request fails or does not finish within
+    ``timeout`` seconds (measured from the start of the call). Results are
+    cached per enhanced prompt; ``fresh`` asks for new ones.
+    """
+    deadline = time.monotonic() + timeout
+    futures = [
+        _executor.submit(metrics.bind(_suggest_list), 'objects', OBJECTS_PROMPT, enhanced_prompt, fresh),
+        _executor.submit(metrics.bind(_suggest_list), 'colors', COLORS_PROMPT, enhanced_prompt, fresh),
+    ]
+    results = []
+    for future in futures:
+        try:
+            results.append(future.result(timeout=max(0, deadline - time.monotonic())))
+        except FutureTimeoutError:
+            future.cancel()
+            results.append([])
+        except Exception:
+            results.append([])
+    objects, color_combinations = results
+    return objects, color_combinations